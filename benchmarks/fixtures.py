@@ -0,0 +1,97 @@
+""" HTML fixtures that mirror the markup of the GitHub pages parsed by github-retriever. """
+
+import random
+
+FEATURES = ["Code", "Issues", "Pull requests", "Discussions", "Actions", "Projects", "Wiki", "Security", "Insights"]
+
+EMOJIS = ["\U0001F44D", "\U0001F440", "❤️", "\U0001F389"]
+
+
+def repo_page(repo_name, features=None, readme_paragraphs=50):
+    """
+    Landing page of a repo with its navigation bar and a rendered README.
+    """
+    features = FEATURES if features is None else features
+    items = []
+    for feature in features:
+        counter = '<span class="Counter">' + str(len(feature)) + '</span>' if feature in ("Issues", "Pull requests") \
+            else ''
+        items.append('<li class="d-flex"><a class="UnderlineNav-item" href="/' + repo_name + '/' + feature.lower()
+                     + '"><span data-content="' + feature + '">' + feature + '</span>' + counter + '</a></li>')
+    readme = "".join('<p>Paragraph ' + str(i) + ' of the README of ' + repo_name + '.</p>'
+                     for i in range(readme_paragraphs))
+    return ('<html><head><meta charset="utf-8"><title>' + repo_name + '</title></head><body>'
+            + '<nav class="js-repo-nav"><ul class="UnderlineNav-body list-style-none">' + "".join(items) + '</ul></nav>'
+            + '<div id="readme"><article class="markdown-body">' + readme + '</article></div>'
+            + '</body></html>').encode('utf8')
+
+
+def listing_page(repo_name, numbers, page=1, total_pages=1):
+    """
+    Page of the discussion listing of a repo, with a blank slate if there are no discussions on this page.
+    """
+    if len(numbers) == 0:
+        body = '<div class="blankslate"><h3>There aren\'t any discussions.</h3></div>'
+    else:
+        body = "".join('<div class="Box-row"><a data-hovercard-type="discussion" href="/' + repo_name
+                       + '/discussions/' + str(number) + '">Discussion ' + str(number) + '</a>'
+                       + '<span class="comment-count"><svg class="octicon octicon-comment"></svg> '
+                       + str(number % 7) + '</span></div>'
+                       for number in numbers)
+        if total_pages > 1:
+            body = body + _pagination(repo_name, page, total_pages)
+    return ('<html><head><meta charset="utf-8"></head><body><div class="repository-content">' + body + '</div></body></html>').encode('utf8')
+
+
+def _pagination(repo_name, page, total_pages):
+    links = []
+    for number in range(1, total_pages + 1):
+        if number == page:
+            links.append('<em class="current" data-total-pages="' + str(total_pages) + '">' + str(number) + '</em>')
+        else:
+            links.append('<a href="/' + repo_name + '/discussions?page=' + str(number) + '">' + str(number) + '</a>')
+    return '<div class="pagination">' + "".join(links) + '</div>'
+
+
+def discussion_page(repo_name, number, posts=10, replies=2, seed=None):
+    """
+    Discussion thread with top-level posts, nested replies, a selected answer, and reactions.
+    """
+    rng = random.Random(seed if seed is not None else number)
+    header = ('<div class="gh-header-show"><h1><span class="js-issue-title">Discussion ' + str(number)
+              + ' of ' + repo_name + '</span> <span class="gh-header-number">#' + str(number) + '</span></h1>'
+              + '<div class="gh-header-meta"><span class="State State--green">Answered</span>'
+              + '<a class="author" href="/author' + str(number) + '">author' + str(number) + '</a> asked'
+              + '<time-ago datetime="2020-06-03T18:41:10Z">Jun 3, 2020</time-ago> in '
+              + '<a href="/' + repo_name + '/discussions/categories/q-a"><g-emoji class="f5">\U0001F64F</g-emoji>'
+              + 'Q&amp;A</a></div></div>')
+    sidebar = ('<div class="discussion-sidebar-item"><svg class="octicon octicon-issue-opened"></svg>'
+               'Converted from issue</div>')
+    answer = rng.randrange(posts) if posts > 0 else -1
+    threads = []
+    for index in range(posts):
+        comments = [_comment(rng, "user" + str(index), index == answer, index)]
+        for reply in range(replies):
+            comments.append(_comment(rng, "replier" + str(reply), False, index * 100 + reply))
+        threads.append('<div class="discussion-comment">' + "".join(comments) + '</div>')
+    return ('<html><head><meta charset="utf-8"></head><body>' + header + '<div class="discussion js-discussion">' + "".join(threads) + '</div>'
+            + sidebar + '</body></html>').encode('utf8')
+
+
+def _comment(rng, author, is_answer, index):
+    check = '<svg class="octicon octicon-check"></svg>' if is_answer else ''
+    paragraphs = "".join('<p>Paragraph ' + str(i) + ' of comment ' + str(index) + ' with <code>code</code> and '
+                         '<a href="https://example.com">a link</a>.</p>' for i in range(rng.randint(1, 5)))
+    reactions = ""
+    for emoji in rng.sample(EMOJIS, rng.randint(0, 2)):
+        reactions = reactions + ('<button><g-emoji>' + emoji + '</g-emoji><span>' + str(rng.randint(1, 9))
+                                 + '</span></button>')
+    return ('<div class="timeline-comment">'
+            + '<div class="timeline-comment-header"><a class="author" href="/' + author + '">' + author + '</a>'
+            + '<time-ago datetime="2020-06-0' + str(rng.randint(1, 9)) + 'T12:00:00Z">Jun 2020</time-ago>'
+            + check + '</div>'
+            + '<div class="comment-body-wrapper"><div><div><table><tbody><tr>'
+            + '<td class="comment-body">' + paragraphs + '</td></tr></tbody></table></div></div></div>'
+            + '<div class="reactions"><div><div><div><form class="js-pick-reaction">' + reactions + '</form>'
+            + '</div></div></div></div>'
+            + '</div>')
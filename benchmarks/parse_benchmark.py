@@ -0,0 +1,78 @@
+"""
+Micro-benchmark: time needed to parse a discussion thread with the previous selectors, the current selectors
+uncompiled, and the current selectors compiled.
+"""
+
+import argparse
+import logging
+import statistics
+import time
+
+import github.xpaths
+from benchmarks.fixtures import discussion_page
+from github.discussion import DiscussionParser
+
+
+# the selected-answer check before it was rewritten with ancestor-or-self, which visited the ancestors of every
+# descendant of a post
+PREVIOUS_SELECTORS = dict(github.xpaths.SELECTORS, **{
+    "post.answer_thread_check": './/ancestor::' + github.xpaths._with_class("div", "discussion-comment") + '//'
+                                + github.xpaths._with_class("svg", "octicon-check")
+})
+
+
+class _UncompiledXPath(object):
+    """ Evaluates an XPath expression from its string on every call (how selectors were applied before). """
+
+    def __init__(self, expression):
+        self.expression = expression
+
+    def __call__(self, root):
+        return root.xpath(self.expression)
+
+
+def time_threads(pages, repetitions):
+    durations = []
+    for _ in range(repetitions):
+        for number, content in pages:
+            start = time.perf_counter()
+            DiscussionParser("https://github.com/benchmark/repo/discussions/" + str(number)).parse(content)
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark parsing of discussion threads.')
+    arg_parser.add_argument('--threads', default=20, type=int, help='number of generated threads')
+    arg_parser.add_argument('--posts', default=25, type=int, help='top-level posts per thread')
+    arg_parser.add_argument('--replies', default=2, type=int, help='replies per top-level post')
+    arg_parser.add_argument('--repetitions', default=5, type=int, help='number of passes over all threads')
+    args = arg_parser.parse_args()
+
+    # extraction errors are expected to be logged for every post, which would distort the measurement
+    logging.getLogger("github-retriever_logger").disabled = True
+
+    pages = [(number, discussion_page("benchmark/repo", number, args.posts, args.replies))
+             for number in range(args.threads)]
+
+    compiled = dict(github.xpaths.XPATHS)
+    uncompiled = {name: _UncompiledXPath(expression) for name, expression in github.xpaths.SELECTORS.items()}
+    previous = {name: _UncompiledXPath(expression) for name, expression in PREVIOUS_SELECTORS.items()}
+
+    results = []
+    for label, xpaths in (("previous", previous), ("uncompiled", uncompiled), ("compiled", compiled)):
+        github.xpaths.XPATHS.update(xpaths)
+        time_threads(pages[:2], 1)  # warm-up
+        durations = time_threads(pages, args.repetitions)
+        results.append((label, statistics.median(durations), statistics.mean(durations)))
+    github.xpaths.XPATHS.update(compiled)
+
+    print("posts per thread: " + str(args.posts * (args.replies + 1)))
+    for label, median, mean in results:
+        print("{0:>10}: median {1:.2f} ms, mean {2:.2f} ms per thread".format(label, median * 1000, mean * 1000))
+    print("speedup of compiled selectors (median): {0:.2f}x over previous, {1:.2f}x over uncompiled".format(
+        results[0][1] / results[2][1], results[1][1] / results[2][1]))
+
+
+if __name__ == '__main__':
+    main()
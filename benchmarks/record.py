@@ -0,0 +1,38 @@
+""" Record pages from a response cache (see --cache-dir) as fixtures for the stand-in server. """
+
+import argparse
+import json
+import os
+import shutil
+
+from urllib.parse import urlsplit
+
+from benchmarks.server import fixture_path
+
+
+def record(cache_dir, fixtures_dir):
+    count = 0
+    for directory, _, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            if not filename.endswith(".json"):
+                continue
+            with open(os.path.join(directory, filename), encoding='utf8') as fp:
+                meta = json.load(fp)
+            url = urlsplit(meta["uri"])
+            target = os.path.join(fixtures_dir, fixture_path(url.path, url.query))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(os.path.join(directory, filename[:-len(".json")] + ".body"), target)
+            count = count + 1
+    return count
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Record cached GitHub pages as benchmark fixtures.')
+    arg_parser.add_argument('--cache-dir', required=True, help='cache directory of a previous run')
+    arg_parser.add_argument('--fixtures-dir', required=True, help='directory for the recorded pages')
+    args = arg_parser.parse_args()
+    print(str(record(args.cache_dir, args.fixtures_dir)) + " page(s) recorded.")
+
+
+if __name__ == '__main__':
+    main()
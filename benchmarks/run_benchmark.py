@@ -0,0 +1,174 @@
+""" End-to-end benchmark of RepoList.retrieve_data against the local stand-in server. """
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from queue import Empty
+
+from benchmarks.server import StandInConfig, StandInServer
+
+MODES = {
+    # features, discussions, discussion posts
+    "features": (True, False, False),
+    "discussions": (False, True, False),
+    "posts": (False, True, True),
+}
+
+
+def _get_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, filename)) for filename in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def _get_stats(url):
+    import requests
+    return requests.get(url + "/_stats").json()
+
+
+def _run_client(url, repo_count, options, results):
+    # executed in a separate process, so that peak RSS only covers the retriever
+    import github
+    from github.parse_pool import ParsePool
+    from github.repo_list import RepoList
+    from util.metrics import metrics, SUMMARY_STAGES
+    from util.rate_limiter import RateLimiter
+    from util.requests import HttpClient, AsyncHttpClient
+
+    github.GITHUB_URL = url
+    if not options["log"]:
+        logging.getLogger("github-retriever_logger").setLevel(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = os.path.join(work_dir, "repos.csv")
+        with open(input_file, 'w', encoding='utf8') as fp:
+            fp.write("repo_name\n")
+            for index in range(repo_count):
+                fp.write("owner" + str(index % 50) + "/repo" + str(index) + "\n")
+
+        features, discussions, discussion_posts = MODES[options["mode"]]
+        rate_limiter = RateLimiter(options["requests_per_second"], options["burst"])
+        stats_before = _get_stats(url)
+        metrics.reset()
+        start = time.perf_counter()
+        with HttpClient(options["workers"], rate_limiter=rate_limiter) as client:
+            async_client = AsyncHttpClient(client, options["async_concurrency"]) if options["asyncio"] else None
+            parse_pool = ParsePool(options["parse_processes"]) if options["parse_processes"] > 0 else None
+            repo_list = RepoList(input_file, os.path.join(work_dir, "output"), ",", client,
+                                 async_client=async_client, parse_pool=parse_pool, file_format=options["format"],
+                                 stream_features=options["stream_features"],
+                                 listing_prefetch=options["listing_prefetch"], blob_store=options["blob_store"])
+            if not options["pipeline"]:
+                repo_list.read_from_csv()
+            repo_list.retrieve_data(100, features, discussions, discussion_posts, options["workers"],
+                                    options["streaming"], options["pipeline"])
+            rows = {name: writer.count for name, writer in repo_list.writers.items()}
+            paths = {name: writer.file_path for name, writer in repo_list.writers.items()}
+            repo_list.close()
+            output_bytes = {name: _get_size(path) for name, path in paths.items()}
+            if async_client:
+                async_client.close()
+            if parse_pool:
+                parse_pool.close()
+        wall_time = time.perf_counter() - start
+        stats_after = _get_stats(url)
+
+    requests_sent = stats_after["requests"] - stats_before["requests"]
+    parse = metrics.get_histogram("parse")
+    results.put({
+        "repos": repo_count,
+        "wall_time_s": round(wall_time, 3),
+        "requests": requests_sent,
+        "requests_per_s": round(requests_sent / wall_time, 1),
+        "rate_limited": stats_after["rate_limited"] - stats_before["rate_limited"],
+        "dropped": stats_after["dropped"] - stats_before["dropped"],
+        "mb_downloaded": round((stats_after["bytes"] - stats_before["bytes"]) / 1024 / 1024, 1),
+        "repo_page_kb": round(metrics.get_counter("repo_page_bytes") / 1024 / repo_count, 1),
+        "pages_parsed": parse["count"],
+        "parse_ms_per_page": round(parse["sum"] / max(1, parse["count"]) * 1000, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stage_seconds": {stage: metrics.get_histogram(stage)["sum"] for stage in SUMMARY_STAGES},
+        "output_mb": round(sum(output_bytes.values()) / 1024 / 1024, 2),
+        "export_mb": {name: round(size / 1024 / 1024, 2) for name, size in output_bytes.items()},
+        "rows": rows
+    })
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark github-retriever against a local stand-in server.')
+    arg_parser.add_argument('--repos', nargs='+', default=[100, 1000, 10000], type=int,
+                            help='numbers of repos to benchmark (default: 100 1000 10000)')
+    arg_parser.add_argument('--mode', default='features', choices=sorted(MODES.keys()))
+    arg_parser.add_argument('--workers', default=8, type=int)
+    arg_parser.add_argument('--requests-per-second', default=1000.0, type=float)
+    arg_parser.add_argument('--burst', default=100, type=int)
+    arg_parser.add_argument('--streaming', action='store_true', help='parse discussion threads while streaming')
+    arg_parser.add_argument('--stream-features', action='store_true',
+                            help='stop downloading repo pages after the navigation bar')
+    arg_parser.add_argument('--listing-prefetch', default=0, type=int,
+                            help='number of discussion listing pages retrieved ahead of the current one')
+    arg_parser.add_argument('--blob-store', action='store_true',
+                            help='write the contents of posts to a content-addressed blob store')
+    arg_parser.add_argument('--pipeline', action='store_true', help='use the bounded-memory pipeline mode')
+    arg_parser.add_argument('--asyncio', action='store_true', help='retrieve discussions with the asyncio client')
+    arg_parser.add_argument('--async-concurrency', default=10, type=int,
+                            help='maximum number of concurrent requests of the asyncio client')
+    arg_parser.add_argument('--parse-processes', default=0, type=int,
+                            help='number of worker processes for parsing discussions')
+    arg_parser.add_argument('--format', default='csv', choices=['csv', 'jsonl', 'parquet'],
+                            help='format of the export files')
+    arg_parser.add_argument('--latency', default=0.01, type=float, help='server latency in seconds')
+    arg_parser.add_argument('--rate-limit-rate', default=0.0, type=float, help='fraction of 429 responses')
+    arg_parser.add_argument('--drop-rate', default=0.0, type=float, help='fraction of dropped connections')
+    arg_parser.add_argument('--max-discussions', default=60, type=int, help='maximum discussions per repo')
+    arg_parser.add_argument('--readme-paragraphs', default=50, type=int,
+                            help='number of README paragraphs on the landing page of a repo')
+    arg_parser.add_argument('--fixtures-dir', default=None, help='directory with recorded pages')
+    arg_parser.add_argument('--log', action='store_true', help='keep the log output of the retriever')
+    arg_parser.add_argument('--json', default=None, help='write the results to this JSON file')
+    args = arg_parser.parse_args()
+
+    config = StandInConfig(args.latency, args.rate_limit_rate, args.drop_rate, args.max_discussions,
+                           fixtures_dir=args.fixtures_dir, readme_paragraphs=args.readme_paragraphs)
+    server = StandInServer(config).start()
+    options = {
+        "mode": args.mode, "workers": args.workers, "requests_per_second": args.requests_per_second,
+        "burst": args.burst, "streaming": args.streaming, "pipeline": args.pipeline, "log": args.log,
+        "asyncio": args.asyncio, "async_concurrency": args.async_concurrency,
+        "parse_processes": args.parse_processes, "format": args.format, "stream_features": args.stream_features,
+        "listing_prefetch": args.listing_prefetch, "blob_store": args.blob_store
+    }
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for repo_count in args.repos:
+            queue = context.Queue()
+            process = context.Process(target=_run_client, args=(server.url, repo_count, options, queue))
+            process.start()
+            result = None
+            while result is None:
+                try:
+                    result = queue.get(timeout=1)
+                except Empty:
+                    if not process.is_alive():
+                        raise RuntimeError("Benchmark run with " + str(repo_count) + " repos failed.")
+            process.join()
+            results.append(result)
+            print(json.dumps(result))
+    finally:
+        server.stop()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf8') as fp:
+            json.dump({"options": options, "server": vars(args), "results": results}, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+""" Local stand-in for github.com that serves repo pages, discussion listings, and discussion threads. """
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from benchmarks.fixtures import repo_page, listing_page, discussion_page
+
+DISCUSSIONS_PER_PAGE = 25
+
+
+class StandInConfig(object):
+    """ Behavior of the stand-in server. """
+
+    def __init__(self, latency=0.0, rate_limit_rate=0.0, drop_rate=0.0, max_discussions=60, posts=10, replies=2,
+                 fixtures_dir=None, seed=0, readme_paragraphs=50, redirects=None):
+        """
+        :param latency: Seconds to wait before answering a request.
+        :param rate_limit_rate: Fraction of requests answered with 429 and Retry-After: 1.
+        :param drop_rate: Fraction of requests for which the connection is closed without an answer.
+        :param max_discussions: Maximum number of discussions per repo (the actual number depends on the repo name).
+        :param posts: Number of top-level posts per discussion thread.
+        :param replies: Number of replies per top-level post.
+        :param fixtures_dir: Directory with recorded pages (see benchmarks/record.py) that are served instead of
+        generated pages if they exist.
+        :param seed: Seed for the random rate limiting and connection drops.
+        :param readme_paragraphs: Number of paragraphs of the README rendered on the landing page of a repo.
+        :param redirects: Dictionary mapping lower-case names of renamed repos to their new names.
+        """
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.drop_rate = drop_rate
+        self.max_discussions = max_discussions
+        self.posts = posts
+        self.replies = replies
+        self.fixtures_dir = fixtures_dir
+        self.readme_paragraphs = readme_paragraphs
+        self.redirects = redirects if redirects else {}
+        self.random = random.Random(seed)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        config = server.config
+        url = urlsplit(self.path)
+
+        if url.path == "/_stats":
+            self._send(200, json.dumps(server.get_stats()).encode('utf8'), "application/json")
+            return
+
+        with server.lock:
+            server.counts["requests"] = server.counts["requests"] + 1
+            drop = config.random.random() < config.drop_rate
+            rate_limited = not drop and config.random.random() < config.rate_limit_rate
+            if drop:
+                server.counts["dropped"] = server.counts["dropped"] + 1
+            if rate_limited:
+                server.counts["rate_limited"] = server.counts["rate_limited"] + 1
+
+        if config.latency > 0:
+            time.sleep(config.latency)
+        if drop:
+            self.close_connection = True
+            self.connection.close()
+            return
+        if rate_limited:
+            self._send(429, b"", "text/plain", {"Retry-After": "1"})
+            return
+
+        location = self._redirect(url)
+        if location:
+            self._send(301, b"", "text/plain", {"Location": location})
+            return
+
+        content = self._recorded(url) or self._generated(url)
+        if content is None:
+            self._send(404, b"Not Found", "text/plain")
+        else:
+            with server.lock:
+                server.counts["bytes"] = server.counts["bytes"] + len(content)
+            self._send(200, content, "text/html; charset=utf-8")
+
+    def _redirect(self, url):
+        # like GitHub, pages of renamed repos redirect to the new name
+        parts = url.path.strip("/").split("/")
+        target = self.server.config.redirects.get("/".join(parts[:2]).lower()) if len(parts) >= 2 else None
+        if target is None:
+            return None
+        return "/" + "/".join([target] + parts[2:]) + ("?" + url.query if url.query else "")
+
+    def _generated(self, url):
+        config = self.server.config
+        parts = url.path.strip("/").split("/")
+        if len(parts) < 2:
+            return None
+        repo_name = parts[0] + "/" + parts[1]
+        if len(parts) == 2:
+            return repo_page(repo_name, readme_paragraphs=config.readme_paragraphs)
+        if len(parts) == 3 and parts[2] == "discussions":
+            page = int(parse_qs(url.query).get("page", ["1"])[0])
+            count = discussion_count(repo_name, config.max_discussions)
+            total_pages = max(1, (count + DISCUSSIONS_PER_PAGE - 1) // DISCUSSIONS_PER_PAGE)
+            # newest discussions first
+            numbers = list(range(count, 0, -1))[(page - 1) * DISCUSSIONS_PER_PAGE:page * DISCUSSIONS_PER_PAGE]
+            return listing_page(repo_name, numbers, page, total_pages if numbers else 1)
+        if len(parts) == 4 and parts[2] == "discussions" and parts[3].isdigit():
+            if int(parts[3]) > discussion_count(repo_name, config.max_discussions):
+                return None
+            return discussion_page(repo_name, int(parts[3]), config.posts, config.replies)
+        return None
+
+    def _recorded(self, url):
+        fixtures_dir = self.server.config.fixtures_dir
+        if not fixtures_dir:
+            return None
+        path = os.path.join(fixtures_dir, fixture_path(url.path, url.query))
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as fp:
+            return fp.read()
+
+    def _send(self, status, content, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """ Threaded HTTP server that counts the requests it receives. """
+
+    daemon_threads = True
+
+    def __init__(self, config, port=0):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.config = config
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "rate_limited": 0, "dropped": 0, "bytes": 0}
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:" + str(self.server_port)
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def discussion_count(repo_name, max_discussions):
+    # stable number of discussions per repo (independent of PYTHONHASHSEED)
+    if max_discussions <= 0:
+        return 0
+    digest = hashlib.md5(repo_name.encode('utf8')).digest()
+    return int.from_bytes(digest[:4], 'big') % (max_discussions + 1)
+
+
+def fixture_path(path, query=""):
+    # file name of a recorded page, e.g. owner/repo/discussions/page-2.html
+    path = path.strip("/")
+    page = parse_qs(query).get("page")
+    if page:
+        path = path + "/page-" + page[0]
+    return path + ".html"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Local stand-in for github.com.')
+    arg_parser.add_argument('--port', default=8080, type=int)
+    arg_parser.add_argument('--latency', default=0.0, type=float)
+    arg_parser.add_argument('--rate-limit-rate', default=0.0, type=float)
+    arg_parser.add_argument('--drop-rate', default=0.0, type=float)
+    arg_parser.add_argument('--fixtures-dir', default=None)
+    args = arg_parser.parse_args()
+
+    config = StandInConfig(args.latency, args.rate_limit_rate, args.drop_rate, fixtures_dir=args.fixtures_dir)
+    server = StandInServer(config, args.port)
+    print("Serving on " + server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,19 @@
 import argparse
 import logging
 
+import github
+import util.log
+from github.parse_pool import ParsePool
 from github.repo_list import RepoList
+from github.shards import merge_shards
+from util.compression import COMPRESSIONS
+from util.exceptions import IllegalConfigurationError
+from util.http_cache import ResponseCache
+from util.metrics import metrics, MetricsReporter
+from util.rate_limiter import RateLimiter
+from util.requests import HttpClient, AsyncHttpClient
+from util.retry import RetryPolicy
+from util.writers import FORMATS
 
 logger = logging.getLogger('github-retriever_logger')
 
@@ -50,6 +62,37 @@ def get_argument_parser():
         help='retrieve discussions threads from list of discussions (default: False)',
         dest='retrieve_discussion_posts'
     )
+    arg_parser.add_argument(
+        '--format',
+        required=False,
+        default='csv',
+        help='format of the export files: csv, jsonl, or parquet (requires the optional package pyarrow)'
+             ' (default: csv)',
+        dest='file_format'
+    )
+    arg_parser.add_argument(
+        '--compression',
+        required=False,
+        default=None,
+        help='compression of the CSV and JSONL export files: gz or zst (requires the optional package zstandard),'
+             ' compressed input files are detected by their extension (default: none)',
+        dest='compression'
+    )
+    arg_parser.add_argument(
+        '--compression-level',
+        required=False,
+        default=None,
+        help='level of the compression of the export files (default: 6 for gz, 3 for zst)',
+        dest='compression_level'
+    )
+    arg_parser.add_argument(
+        '--blob-store',
+        required=False,
+        default=False,
+        help='write the contents of discussion posts to a compressed content-addressed blob store and only their'
+             ' SHA-256 hashes to the posts export (default: False)',
+        dest='blob_store'
+    )
     arg_parser.add_argument(
         '-b', '--backup-frequency',
         required=False,
@@ -57,6 +100,204 @@ def get_argument_parser():
         help='number of repos to process before saving the current state (default: 100)',
         dest='backup_frequency'
     )
+    arg_parser.add_argument(
+        '-w', '--workers',
+        required=False,
+        default=1,
+        help='number of repos to process concurrently (default: 1)',
+        dest='workers'
+    )
+    arg_parser.add_argument(
+        '--requests-per-second',
+        required=False,
+        default=2.0,
+        help='maximum number of requests per second sent to GitHub (default: 2.0)',
+        dest='requests_per_second'
+    )
+    arg_parser.add_argument(
+        '--burst',
+        required=False,
+        default=4,
+        help='maximum number of requests that may be sent in a burst (default: 4)',
+        dest='burst'
+    )
+    arg_parser.add_argument(
+        '--pool-size',
+        required=False,
+        default=10,
+        help='maximum number of pooled keep-alive connections to GitHub (default: 10)',
+        dest='pool_size'
+    )
+    arg_parser.add_argument(
+        '--http2',
+        required=False,
+        default=False,
+        help='use HTTP/2, requires the optional package httpx[http2] (default: False)',
+        dest='http2'
+    )
+    arg_parser.add_argument(
+        '--max-attempts',
+        required=False,
+        default=3,
+        help='maximum number of attempts for requests that fail because of transient errors (default: 3)',
+        dest='max_attempts'
+    )
+    arg_parser.add_argument(
+        '--retry-rounds',
+        required=False,
+        default=1,
+        help='number of times repos that failed because of transient errors are retried at the end of the run'
+             ' (default: 1)',
+        dest='retry_rounds'
+    )
+    arg_parser.add_argument(
+        '--resume',
+        required=False,
+        default=False,
+        help='resume a previous run with the same input file and output directory,'
+             ' skipping completed repos and retrying failed ones (default: False)',
+        dest='resume'
+    )
+    arg_parser.add_argument(
+        '--cache-dir',
+        required=False,
+        default=None,
+        help='directory for caching retrieved pages (default: no cache)',
+        dest='cache_dir'
+    )
+    arg_parser.add_argument(
+        '--cache-ttl',
+        required=False,
+        default=86400,
+        help='number of seconds for which cached pages are used without revalidating them (default: 86400)',
+        dest='cache_ttl'
+    )
+    arg_parser.add_argument(
+        '--cache-size',
+        required=False,
+        default=1024,
+        help='maximum size of the cache in MB (default: 1024)',
+        dest='cache_size'
+    )
+    arg_parser.add_argument(
+        '--offline',
+        required=False,
+        default=False,
+        help='only use cached pages and do not send any requests (default: False)',
+        dest='offline'
+    )
+    arg_parser.add_argument(
+        '--previous-run',
+        required=False,
+        default=None,
+        help='progress database (<input>_progress.sqlite) of a previous run in another output directory, only'
+             ' discussions that are new or have changed since that run are retrieved and exported (default: none)',
+        dest='previous_run'
+    )
+    arg_parser.add_argument(
+        '--streaming-parse',
+        required=False,
+        default=False,
+        help='parse discussion threads while downloading them to limit memory usage (default: False)',
+        dest='streaming_parse'
+    )
+    arg_parser.add_argument(
+        '--stream-features',
+        required=False,
+        default=False,
+        help='stop downloading repo pages once the navigation bar with the features has been parsed, which saves'
+             ' bandwidth, but the connection is closed and the pages are not cached (default: False)',
+        dest='stream_features'
+    )
+    arg_parser.add_argument(
+        '--listing-prefetch',
+        required=False,
+        default=4,
+        help='number of discussion listing pages retrieved concurrently ahead of the current one, once the number of'
+             ' pages is known from the pagination (default: 4)',
+        dest='listing_prefetch'
+    )
+    arg_parser.add_argument(
+        '--pipeline',
+        required=False,
+        default=False,
+        help='read, retrieve, and export repos one after another instead of keeping all of them in memory'
+             ' (default: False)',
+        dest='pipeline'
+    )
+    arg_parser.add_argument(
+        '--asyncio',
+        required=False,
+        default=False,
+        help='retrieve discussions with an asyncio client, requires the optional package httpx (default: False)',
+        dest='asyncio'
+    )
+    arg_parser.add_argument(
+        '--async-concurrency',
+        required=False,
+        default=10,
+        help='maximum number of concurrent requests of the asyncio client (default: 10)',
+        dest='async_concurrency'
+    )
+    arg_parser.add_argument(
+        '--parse-processes',
+        required=False,
+        default=0,
+        help='number of worker processes for parsing discussions, 0 to parse them in the retrieving threads'
+             ' (default: 0)',
+        dest='parse_processes'
+    )
+    arg_parser.add_argument(
+        '--shard-index',
+        required=False,
+        default=0,
+        help='index of the shard of the input file to process, starting with 0 (default: 0)',
+        dest='shard_index'
+    )
+    arg_parser.add_argument(
+        '--shard-count',
+        required=False,
+        default=1,
+        help='number of shards the input file is split into, e.g., one per machine (default: 1)',
+        dest='shard_count'
+    )
+    arg_parser.add_argument(
+        '--merge-shards',
+        required=False,
+        default=False,
+        help='merge the export files of all shards in the output directory instead of retrieving data'
+             ' (default: False)',
+        dest='merge_shards'
+    )
+    arg_parser.add_argument(
+        '--github-url',
+        required=False,
+        default=github.GITHUB_URL,
+        help='base URL of the retrieved pages, e.g., of a local stand-in server (default: https://github.com)',
+        dest='github_url'
+    )
+    arg_parser.add_argument(
+        '--json-log',
+        required=False,
+        default=None,
+        help='file to which all log messages are additionally written as JSON objects, one per line (default: none)',
+        dest='json_log'
+    )
+    arg_parser.add_argument(
+        '--metrics-interval',
+        required=False,
+        default=60,
+        help='number of seconds between two progress summaries, 0 disables them (default: 60)',
+        dest='metrics_interval'
+    )
+    arg_parser.add_argument(
+        '--metrics-file',
+        required=False,
+        default=None,
+        help='file to which metrics are written periodically, as JSON if it ends with .json and in the'
+             ' Prometheus text format otherwise (default: none)',
+        dest='metrics_file'
+    )
     return arg_parser
 
 
@@ -68,17 +309,80 @@ def main():
     retrieve_discussions = args.retrieve_discussions == "True"
     retrieve_discussion_posts = args.retrieve_discussion_posts == "True"
     backup_frequency = int(args.backup_frequency)
+    workers = int(args.workers)
+    listing_prefetch = int(args.listing_prefetch)
+    http2 = args.http2 == "True"
+    resume = args.resume == "True"
+    offline = args.offline == "True"
+    streaming_parse = args.streaming_parse == "True"
+    pipeline = args.pipeline == "True"
+    use_asyncio = args.asyncio == "True"
+    github.GITHUB_URL = args.github_url.rstrip("/")
+    if args.json_log:
+        util.log.add_json_log(args.json_log)
+    shard_index = int(args.shard_index)
+    shard_count = int(args.shard_count)
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise IllegalConfigurationError("The shard index has to be between 0 and the number of shards minus 1.")
+
+    if args.file_format not in FORMATS:
+        raise IllegalConfigurationError("Unknown format: " + args.file_format)
+    if args.compression is not None and args.compression not in COMPRESSIONS:
+        raise IllegalConfigurationError("Unknown compression: " + args.compression)
+    if args.compression is not None and args.file_format == "parquet":
+        raise IllegalConfigurationError("Parquet files are already compressed.")
+    compression_level = int(args.compression_level) if args.compression_level is not None else None
+
+    if args.merge_shards == "True":
+        if args.file_format != "csv":
+            raise IllegalConfigurationError("Only CSV export files can be merged.")
+        merge_shards(args.input_file, args.output_dir, args.delimiter, shard_count, args.compression,
+                     compression_level)
+        return
+
+    cache = None
+    if args.cache_dir:
+        cache = ResponseCache(args.cache_dir, float(args.cache_ttl), int(args.cache_size) * 1024 * 1024, offline)
+    elif offline:
+        raise IllegalConfigurationError("Offline mode requires a cache directory.")
+
+    # one HTTP client with a shared connection pool, rate limiter, and cache for all repos
+    rate_limiter = RateLimiter(float(args.requests_per_second), int(args.burst))
+    # missing pages do not appear in the cache when retrying in offline mode
+    retry_policy = RetryPolicy(1 if offline else int(args.max_attempts))
+    # each worker may retrieve listing pages ahead
+    client = HttpClient(max(int(args.pool_size), workers * (1 + listing_prefetch)), http2, rate_limiter, cache,
+                        retry_policy)
+    async_client = AsyncHttpClient(client, int(args.async_concurrency)) if use_asyncio else None
+    parse_pool = ParsePool(int(args.parse_processes)) if int(args.parse_processes) > 0 else None
+    reporter = MetricsReporter(metrics, float(args.metrics_interval), args.metrics_file).start()
 
-    # process repos
-    repo_list = RepoList(args.input_file, args.output_dir, args.delimiter)
-    repo_list.read_from_csv()
-    repo_list.retrieve_data(backup_frequency, retrieve_features, retrieve_discussions, retrieve_discussion_posts)
-    if retrieve_features:
-        repo_list.write_repos_to_csv()
-    if retrieve_discussions:
-        repo_list.write_discussions_to_csv()
-    if retrieve_discussion_posts:
-        repo_list.write_discussion_posts_to_csv()
+    repo_list = None
+    try:
+        # process repos
+        repo_list = RepoList(args.input_file, args.output_dir, args.delimiter, client, resume=resume,
+                             retry_rounds=0 if offline else int(args.retry_rounds), async_client=async_client,
+                             parse_pool=parse_pool, shard_index=shard_index, shard_count=shard_count,
+                             file_format=args.file_format, previous_run=args.previous_run,
+                             stream_features=args.stream_features == "True", listing_prefetch=listing_prefetch,
+                             compression=args.compression, compression_level=compression_level,
+                             blob_store=args.blob_store == "True")
+        if not pipeline:
+            repo_list.read_from_csv()
+        repo_list.retrieve_data(backup_frequency, retrieve_features, retrieve_discussions, retrieve_discussion_posts,
+                                workers, streaming_parse, pipeline)
+    except KeyboardInterrupt:
+        logger.info("Run interrupted, continue it with --resume True.")
+    finally:
+        # export files and the progress database are closed even if the run failed
+        if repo_list is not None:
+            repo_list.close()
+        if parse_pool:
+            parse_pool.close()
+        if async_client:
+            async_client.close()
+        client.close()
+        reporter.stop()
 
 
 if __name__ == '__main__':
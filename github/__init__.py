@@ -2,5 +2,8 @@ import util.log
 
 LOG_FILE = 'github-retriever.log'
 
+# base URL of all retrieved pages (can be changed to use a mirror or a local stand-in server)
+GITHUB_URL = 'https://github.com'
+
 # initialize named global logger
 logger = util.log.configure_logger('github-retriever_logger', LOG_FILE)
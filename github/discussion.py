@@ -2,19 +2,32 @@ import logging
 
 from lxml.html import HtmlElement
 
+import github
+from github.page import Page
 from github.post import Post
-from util.requests import delay_next_request
-from lxml import html
+from github.xpaths import select, select_first
+from util.metrics import metrics
+from lxml import etree, html
 
 logger = logging.getLogger("github-retriever_logger")
 
+# number of bytes fed to the parser at once when parsing discussions while they are downloaded
+STREAMING_CHUNK_SIZE = 64 * 1024
+
+# marks elements whose content has been discarded after parsing them
+DISCARDED_ATTRIBUTE = "data-github-retriever-discarded"
+
 
 class Discussion(object):
     """ A GitHub Discussion. """
 
-    def __init__(self, repo, github_path):
-        self.repo = repo
-        self.uri = "https://github.com" + github_path
+    __slots__ = ("repo_name", "uri", "title", "number", "state", "author", "timestamp", "emoji", "category",
+                 "converted_from_issue", "posts", "failed", "failure", "marker")
+
+    def __init__(self, repo_name, github_path, marker=None):
+        # the name instead of the repo, so that discussions do not keep their repo alive
+        self.repo_name = str(repo_name)
+        self.uri = github.GITHUB_URL + github_path
 
         # discussion metadata
         self.title = None
@@ -29,8 +42,15 @@ class Discussion(object):
         # discussion posts
         self.posts = []
 
+        # true if the discussion posts could not be retrieved
+        self.failed = False
+        self.failure = None
+
+        # changes whenever the discussion changes (see Page.get_discussion_markers), used by incremental runs
+        self.marker = marker
+
     def get_column_values(self):
-        return [self.repo.full_name, self.uri, self.title, self.number, self.state, self.author, self.timestamp,
+        return [self.repo_name, self.uri, self.title, self.number, self.state, self.author, self.timestamp,
                 self.emoji, self.category, self.converted_from_issue]
 
     @classmethod
@@ -38,142 +58,244 @@ class Discussion(object):
         return ["repo_name", "discussion", "title", "number", "state", "author", "timestamp",
                 "emoji", "category", "converted_from_issue"]
 
+    @classmethod
+    def get_column_types(cls):
+        return ["string", "string", "string", "int", "string", "string", "timestamp",
+                "string", "string", "bool"]
+
+    def iter_post_rows(self):
+        for post in self.posts:
+            yield post.get_column_values(self)
+
     def __str__(self):
         return str(self.uri)
 
-    def retrieve_discussion_posts(self, session):
-        delay_next_request()
-        response = None
-        try:
-            # retrieve discussion posts
-            response = session.get(self.uri)
-        except ConnectionError:
-            logger.error("An error occurred while accessing discussion posts: " + str(self))
-
-        if response and response.ok:
-            logger.info("Successfully accessed discussion posts: " + str(self))
-            tree = html.fromstring(response.content)
-            self._retrieve_discussion_metadata(tree)
-            self._retrieve_discussion_posts(tree)
+    def retrieve_discussion_posts(self, client, streaming=False, parse_pool=None):
+        # the parse pool needs the whole content
+        stream = streaming and parse_pool is None
+        _, self.failure = client.retry_policy.execute(
+            self.uri, lambda: client.get(self.uri, stream=stream),
+            lambda response: self._process_response(response, streaming, parse_pool))
+        self._complete_retrieval()
+
+    async def retrieve_discussion_posts_async(self, async_client, streaming=False, parse_pool=None):
+        """
+        Retrieve the discussion posts with the asyncio client, the response is parsed in its thread pool.
+        """
+        stream = streaming and parse_pool is None
+        _, self.failure = await async_client.retry_policy.execute_async(
+            self.uri, lambda: async_client.get(self.uri, stream=stream),
+            lambda response: async_client.run_in_executor(self._process_response, response, streaming, parse_pool))
+        self._complete_retrieval()
+
+    def _complete_retrieval(self):
+        if self.failure:
+            logger.error("Retrieving discussion posts failed: %s", self.failure)
+            self.failed = True
         else:
-            logger.info("No data found in discussion posts: " + str(self))
+            metrics.increment("discussions")
+            metrics.increment("posts", len(self.posts))
+
+    def _process_response(self, response, streaming, parse_pool=None):
+        logger.info("Successfully accessed discussion posts: %s", self)
+        if parse_pool:
+            # the worker process receives the raw content and returns plain tuples
+            with metrics.timer("parse"):
+                metadata, posts = parse_pool.parse_discussion(self.uri, response.content, streaming)
+        elif streaming:
+            parser = DiscussionParser(self.uri)
+            try:
+                parser.parse_streaming(response.iter_content(STREAMING_CHUNK_SIZE))
+            except OSError:
+                # the transport errors of the requests package are subclasses of OSError
+                logger.error("An error occurred while reading discussion posts: %s", self)
+                return False
+            finally:
+                response.close()
+            metadata, posts = parser.metadata, parser.posts
+        else:
+            parser = DiscussionParser(self.uri)
+            parser.parse(response.content)
+            metadata, posts = parser.metadata, parser.posts
+
+        # posts of a previous, incomplete attempt are replaced
+        self.set_metadata(metadata)
+        self.posts = [Post.from_record(record) for record in posts]
+        return True
+
+    def set_metadata(self, metadata):
+        self.title, self.number, self.state, self.author, self.timestamp, self.emoji, self.category, \
+            self.converted_from_issue = metadata
+
+
+def parse_discussion(uri, content, streaming=False):
+    """
+    Parse a retrieved discussion page, used by the worker processes of the parse pool.
+    :param uri: URI of the discussion (used for logging).
+    :param content: Raw content of the page.
+    :param streaming: Parse the content incrementally to limit the memory needed.
+    :return: Tuple (metadata, posts) with the metadata values and one tuple of values for each post.
+    """
+    parser = DiscussionParser(uri)
+    if streaming:
+        parser.parse_streaming(content[start:start + STREAMING_CHUNK_SIZE]
+                               for start in range(0, len(content), STREAMING_CHUNK_SIZE))
+    else:
+        parser.parse(content)
+    return parser.metadata, parser.posts
+
+
+class DiscussionParser(object):
+    """
+    Extracts the metadata and posts of a discussion page as plain tuples, which can be sent between processes.
+    """
 
-    def _retrieve_discussion_metadata(self, root):
+    def __init__(self, uri):
+        self.uri = uri
+        self.metadata = None
+        self.posts = []
+
+    def __str__(self):
+        return str(self.uri)
+
+    def parse(self, content):
+        tree = Page(self.uri, content).parse()
+        with metrics.timer("extract"):
+            self.metadata = self._extract_metadata(tree)
+            logger.info("Retrieving posts...")
+            for post_div in select("discussion.posts", tree):
+                self.posts.append(self._extract_post(post_div))
+
+    def parse_streaming(self, chunks):
+        """
+        Parse the discussion incrementally while it is downloaded.
+        Posts are extracted as soon as the outermost comment thread (discussion-comment) containing them has been
+        parsed completely, which is all the context the post selectors need, and the thread is discarded afterwards.
+        Hence, the memory needed does not depend on the number of threads in a discussion.
+        The metadata is extracted from the remaining tree (header and sidebar) at the end.
+        """
+        parser = etree.HTMLPullParser(events=("end",), tag="div")
+        parser.set_element_class_lookup(html.HtmlElementClassLookup())
+
+        logger.info("Retrieving posts...")
+        for chunk in chunks:
+            metrics.increment("bytes_downloaded", len(chunk))
+            # parsing and extraction are interleaved and measured together
+            with metrics.timer("parse"):
+                parser.feed(chunk)
+                self._process_parsed_divs(parser)
+        with metrics.timer("parse"):
+            root = parser.close()
+            self._process_parsed_divs(parser)
+            self.metadata = self._extract_metadata(root)
+
+    def _process_parsed_divs(self, parser):
+        for _, div in parser.read_events():
+            if _has_class(div, "timeline-comment"):
+                # posts inside a comment thread are extracted once the whole thread has been parsed
+                if _find_ancestor(div, "discussion-comment") is None and _find_ancestor(div, "discussion") is not None:
+                    self.posts.append(self._extract_post(div))
+                    _discard(div)
+            elif _has_class(div, "discussion-comment") and _find_ancestor(div, "discussion-comment") is None:
+                if _find_ancestor(div, "discussion") is not None:
+                    for post_div in select("thread.posts", div):
+                        self.posts.append(self._extract_post(post_div))
+                _discard(div)
+
+    def _extract_metadata(self, root):
+        """
+        :return: Tuple (title, number, state, author, timestamp, emoji, category, converted_from_issue).
+        """
         logger.info("Retrieving discussion metadata...")
 
-        self.title = _retrieve_element_content(root, "span", "js-issue-title")
-        if self.title is None:
-            logger.error("Error retrieving title of discussion in: " + str(self))
+        title = select_first("discussion.title", root)
+        if title is None:
+            logger.error("Error retrieving title of discussion in: %s", self)
 
-        self.number = _retrieve_element_content(root, "span", "gh-header-number")
-        if self.number:
-            self.number = int(self.number.replace("#", ""))
+        number = select_first("discussion.number", root)
+        if number:
+            number = int(number.replace("#", ""))
         else:
-            logger.error("Error retrieving number of discussion in: " + str(self))
+            logger.error("Error retrieving number of discussion in: %s", self)
 
-        header_prefix = '//' + _select_elements_with_class("div", "gh-header-meta")
+        state = select_first("discussion.state", root)
+        if state is None:
+            logger.error("Error retrieving state of discussion in: %s", self)
 
-        self.state = _retrieve_element_content(root, "span", "State", "text", header_prefix)
-        if self.state is None:
-            logger.error("Error retrieving state of discussion in: " + str(self))
-
-        self.author = _retrieve_element_content(root, "a", "author", "@href", header_prefix)
-        if self.author:
-            self.author = self.author.replace("/", "")
+        author = select_first("discussion.author", root)
+        if author:
+            author = author.replace("/", "")
         else:
-            logger.error("Error retrieving author of discussion in: " + str(self))
+            logger.error("Error retrieving author of discussion in: %s", self)
 
-        self.emoji = _retrieve_element_content(root, "g-emoji", "f5", "text", header_prefix)
-        if self.emoji is None:
-            logger.error("Error retrieving emoji of discussion in: " + str(self))
+        emoji = select_first("discussion.emoji", root)
+        if emoji is None:
+            logger.error("Error retrieving emoji of discussion in: %s", self)
 
-        self.category = _retrieve_element_content(root, "g-emoji", "f5", "parent-text", header_prefix)
-        if self.category is None:
-            logger.error("Error retrieving category of discussion in: " + str(self))
+        category = select_first("discussion.category", root)
+        if category is None:
+            logger.error("Error retrieving category of discussion in: %s", self)
 
-        self.timestamp = _retrieve_element_content(root, "time-ago", None, "@datetime", header_prefix)
-        if self.timestamp is None:
-            logger.error("Error retrieving timestamp of discussion in: " + str(self))
+        timestamp = select_first("discussion.timestamp", root)
+        if timestamp is None:
+            logger.error("Error retrieving timestamp of discussion in: %s", self)
 
-        sidebar_prefix = "//" + _select_elements_with_class("div", "discussion-sidebar-item")
-        conversion_remark = _retrieve_element_content(root, "svg", "octicon-issue-opened", "parent-text",
-                                                      sidebar_prefix)
-        self.converted_from_issue = conversion_remark is not None \
-                                    and conversion_remark.strip() == "Converted from issue"
+        conversion_remark = select_first("discussion.conversion_remark", root)
+        converted_from_issue = conversion_remark is not None and conversion_remark.strip() == "Converted from issue"
 
-    def _retrieve_discussion_posts(self, root):
-        logger.info("Retrieving posts...")
+        return title, number, state, author, timestamp, emoji, category, converted_from_issue
 
-        post_divs = root.xpath('.//' + _select_elements_with_class("div", "discussion")
-                               + '//' + _select_elements_with_class("div", "timeline-comment"))
-
-        for post_div in post_divs:
-            post = Post(self)
-
-            post.author = _retrieve_element_content(post_div, "a", "author", "@href")
-            if post.author:
-                post.author = post.author.replace("/", "")
-            else:
-                logger.error("Error retrieving author of discussion post in: " + str(self))
-
-            post.timestamp = _retrieve_element_content(post_div, "time-ago", None, "@datetime")
-            if post.timestamp is None:
-                logger.error("Error retrieving timestamp of discussion post in: " + str(self))
-
-            post.is_part_of_selected_answer =\
-                len(post_div.xpath('.//' + _select_elements_with_class("svg", "octicon-check"))) > 0 \
-                or len(post_div.xpath('.//ancestor::' + _select_elements_with_class("div", "discussion-comment") + '//'
-                                      + _select_elements_with_class("svg", "octicon-check"))) > 0
-
-            content_elements = post_div.xpath('./*/*/*/*/*/*/' + _select_elements_with_class("td", "comment-body") + '/node()')
-            post.content = "\n".join(list(map(lambda elem: str(
-                html.tostring(elem, pretty_print=True, encoding="unicode", with_tail=False)).strip(),
-                                              filter(lambda elem: type(elem) is HtmlElement, content_elements))))
-            if post.content is None:
-                logger.error("Error retrieving content of discussion post in: " + str(self))
-
-            emojis = post_div.xpath('./*/*/*/*/' + _select_elements_with_class("form", "js-pick-reaction")
-                                    + '//g-emoji/text()')
-            counts = post_div.xpath('./*/*/*/*/' + _select_elements_with_class("form", "js-pick-reaction")
-                                    + '//span/text()')
-            if len(emojis) > 0 and len(counts) > 0:
-                post.reactions = [emojis, list(map(lambda count: int(count), counts))]
-            else:
-                post.reactions = None
-
-            self.posts.append(post)
-
-
-def _retrieve_element_content(root, element, class_name=None, target="text", prefix=None):
-    if prefix:
-        xpath_expression = prefix
-    else:
-        xpath_expression = ""
+    def _extract_post(self, post_div):
+        """
+        :return: Tuple (author, timestamp, reactions, is_part_of_selected_answer, content).
+        """
+        author = select_first("post.author", post_div)
+        if author:
+            author = author.replace("/", "")
+        else:
+            logger.error("Error retrieving author of discussion post in: %s", self)
+
+        timestamp = select_first("post.timestamp", post_div)
+        if timestamp is None:
+            logger.error("Error retrieving timestamp of discussion post in: %s", self)
+
+        is_part_of_selected_answer =\
+            len(select("post.answer_check", post_div)) > 0 \
+            or len(select("post.answer_thread_check", post_div)) > 0
+
+        content_elements = select("post.content", post_div)
+        content = "\n".join(list(map(lambda elem: str(
+            html.tostring(elem, pretty_print=True, encoding="unicode", with_tail=False)).strip(),
+                                      filter(lambda elem: type(elem) is HtmlElement, content_elements))))
+
+        # plain strings do not reference the parsed tree
+        emojis = [str(emoji) for emoji in select("post.reaction_emojis", post_div)]
+        counts = select("post.reaction_counts", post_div)
+        if len(emojis) > 0 and len(counts) > 0:
+            reactions = [emojis, list(map(lambda count: int(count), counts))]
+        else:
+            reactions = None
 
-    if class_name:
-        element_selector = _select_elements_with_class(element, class_name)
-    else:
-        element_selector = element
-
-    if target == "text":
-        xpath_expression = xpath_expression + '//' + element_selector + '/text()'
-    elif target == "parent-text":
-        xpath_expression = xpath_expression + '//' + element_selector + '/../text()'
-    elif target.startswith("@"):
-        xpath_expression = xpath_expression + '//' + element_selector + '/' + target
-    else:
-        logger.error("Invalid target: " + target)
+        return author, timestamp, reactions, is_part_of_selected_answer, content
 
-    content = list(filter(lambda elem: len(elem) > 0,
-                          map(lambda elem: elem.strip(),
-                              root.xpath("." + xpath_expression))))
 
-    if len(content) > 0:
-        return str(content[0]).strip()
-    else:
-        return None
+def _has_class(element, class_name):
+    return class_name in element.get("class", "").split()
+
+
+def _find_ancestor(element, class_name):
+    for ancestor in element.iterancestors("div"):
+        if _has_class(ancestor, class_name):
+            return ancestor
+    return None
 
 
-def _select_elements_with_class(element, class_name):
-    # see https://stackoverflow.com/a/9133579
-    return element + '[contains(concat(" ", normalize-space(@class), " "), " ' + class_name + ' ")]'
+def _discard(element):
+    # free the subtree of a processed element and remove processed elements before it
+    element.clear(keep_tail=True)
+    element.set(DISCARDED_ATTRIBUTE, "")
+    parent = element.getparent()
+    previous = element.getprevious()
+    while previous is not None and previous.get(DISCARDED_ATTRIBUTE) is not None:
+        parent.remove(previous)
+        previous = element.getprevious()
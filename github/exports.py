@@ -0,0 +1,34 @@
+""" Names of the files written for an input file. """
+
+import os
+
+from util.compression import strip_compression_extension
+
+# suffixes appended to the name of the input file to get the names of the export files
+EXPORT_SUFFIXES = {
+    "repos": "",
+    "discussions": "_discussions",
+    "discussion posts": "_discussion_posts",
+    "failures": "_failures"
+}
+
+
+def get_export_path(output_dir, filename, name, file_format="csv", compression=None):
+    """
+    :param compression: Compression of the export file ("gz" or "zst"), which is appended as extension.
+    """
+    return os.path.join(output_dir, _get_base_name(filename) + EXPORT_SUFFIXES[name] + "." + file_format
+                        + ("." + compression if compression else ""))
+
+
+def get_blob_store_path(output_dir, filename):
+    return os.path.join(output_dir, _get_base_name(filename) + "_discussion_post_contents")
+
+
+def get_state_store_path(output_dir, filename):
+    return os.path.join(output_dir, _get_base_name(filename) + "_progress.sqlite")
+
+
+def _get_base_name(filename):
+    # name of the input file without extensions (e.g., repos for repos.csv.gz)
+    return os.path.splitext(strip_compression_extension(filename))[0]
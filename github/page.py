@@ -0,0 +1,87 @@
+import logging
+
+from lxml import etree, html
+
+from github.xpaths import select, select_first
+from util.metrics import metrics
+
+logger = logging.getLogger("github-retriever_logger")
+
+
+def parse_features_streaming(chunks):
+    """
+    Parse a repo page while it is downloaded and stop as soon as the navigation bar has been parsed,
+    so that the rest of the page (e.g., the rendered README) does not need to be downloaded.
+    :param chunks: Iterable of byte strings.
+    :return: Tuple (features, bytes_read) with the labels of the tabs as returned by Page.get_features()
+             (an empty list if the page does not contain a navigation bar).
+    """
+    parser = etree.HTMLPullParser(events=("end",), tag="ul")
+    bytes_read = 0
+    for chunk in chunks:
+        bytes_read = bytes_read + len(chunk)
+        with metrics.timer("parse"):
+            parser.feed(chunk)
+            for _, ul in parser.read_events():
+                if "UnderlineNav-body" in ul.get("class", ""):
+                    return [select("repo.feature_labels", item) for item in select("repo.features", ul)], bytes_read
+    return [], bytes_read
+
+
+class Page(object):
+    """ A retrieved GitHub page that is parsed once and shared by all extractors. """
+
+    def __init__(self, uri, content):
+        self.uri = str(uri)
+        self.content = content
+        self._tree = None
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.url, response.content)
+
+    @property
+    def tree(self):
+        return self.parse()
+
+    def parse(self):
+        if self._tree is None:
+            with metrics.timer("parse"):
+                self._tree = html.fromstring(self.content)
+            # the raw content is not needed anymore once the page has been parsed
+            self.content = None
+        return self._tree
+
+    def get_features(self):
+        # labels of the tabs in the repo navigation bar (name and optional counter)
+        return [select("repo.feature_labels", item) for item in select("repo.features", self.tree)]
+
+    def get_discussion_links(self):
+        return select("listing.discussion_links", self.tree)
+
+    def get_discussion_markers(self):
+        """
+        :return: Dictionary mapping the links of the listed discussions to a marker that changes whenever a
+                 discussion changes (number of comments and time of the last activity).
+        """
+        markers = {}
+        for item in select("listing.items", self.tree):
+            link = select_first("listing.item_link", item)
+            comment_count = select_first("listing.item_comment_count", item)
+            if link is not None and comment_count is not None:
+                markers[link] = comment_count + "|" + (select_first("listing.item_activity", item) or "")
+        return markers
+
+    def get_total_pages(self):
+        """
+        :return: Number of listing pages according to the pagination or None if there is no pagination.
+        """
+        total_pages = select_first("listing.total_pages", self.tree)
+        return int(total_pages) if total_pages and total_pages.isdigit() else None
+
+    def is_blank_slate(self):
+        h3 = select("listing.blank_slate", self.tree)
+        return any(text.strip() == "There aren't any discussions." for text in h3)
+
+    def __str__(self):
+        return self.uri
@@ -0,0 +1,35 @@
+""" Pool of worker processes for parsing retrieved discussions. """
+
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+from github.discussion import parse_discussion
+
+
+class ParsePool(object):
+    """
+    Parses discussion pages in worker processes, so that parsing and extraction are not limited by the global
+    interpreter lock. The workers receive the raw content and return plain tuples (metadata values and post values)
+    instead of Discussion and Post objects.
+    """
+
+    def __init__(self, processes=None):
+        # worker processes are spawned because forking a process with running threads is not safe
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+
+    def parse_discussion(self, uri, content, streaming=False):
+        """
+        Parse a discussion in a worker process and wait for the result (may be called from any thread).
+        :return: Tuple (metadata, posts), see github.discussion.parse_discussion.
+        """
+        return self.executor.submit(parse_discussion, uri, content, streaming).result()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -6,18 +6,33 @@ logger = logging.getLogger("github-retriever_logger")
 class Post(object):
     """ A GitHub Discussion Post. """
 
-    def __init__(self, discussion):
-        self.discussion = discussion
+    # posts are the most numerous objects of a run, slots avoid a dictionary per instance
+    __slots__ = ("author", "timestamp", "reactions", "is_part_of_selected_answer", "content")
+
+    def __init__(self):
         self.author = None
         self.timestamp = None
         self.reactions = None
         self.is_part_of_selected_answer = None
         self.content = None
 
-    def get_column_values(self):
-        return [self.discussion.repo.full_name, self.discussion.uri, self.author, self.timestamp, self.reactions,
+    @classmethod
+    def from_record(cls, record):
+        """
+        :param record: Tuple (author, timestamp, reactions, is_part_of_selected_answer, content).
+        """
+        post = cls()
+        post.author, post.timestamp, post.reactions, post.is_part_of_selected_answer, post.content = record
+        return post
+
+    def get_column_values(self, discussion):
+        return [discussion.repo_name, discussion.uri, self.author, self.timestamp, self.reactions,
                 self.is_part_of_selected_answer, self.content]
 
     @classmethod
     def get_column_names(cls):
         return ["repo_name", "discussion", "author", "timestamp", "reactions", "is_part_of_selected_answer", "content"]
+
+    @classmethod
+    def get_column_types(cls):
+        return ["string", "string", "string", "timestamp", "reactions", "bool", "string"]
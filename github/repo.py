@@ -1,100 +1,180 @@
+import asyncio
 import logging
-import requests
 
-from lxml import html
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 
+import github
 from github.discussion import Discussion
-from util.requests import delay_next_request
+from github.page import Page, parse_features_streaming
+from util.metrics import metrics
 
 logger = logging.getLogger("github-retriever_logger")
 
+# features in the order of the exported columns, named as in the navigation bar of a repo
+FEATURES = ("Code", "Issues", "Pull requests", "Discussions", "Actions", "Projects", "Wiki", "Security", "Insights")
+FEATURE_BITS = {name: 1 << index for index, name in enumerate(FEATURES)}
+
+# number of discussions on a complete listing page
+DISCUSSIONS_PER_PAGE = 25
+
+# number of bytes of a repo page read at once when the download stops after the navigation bar
+FEATURES_CHUNK_SIZE = 16 * 1024
+
+
+def _feature_property(name):
+    bit = FEATURE_BITS[name]
+
+    def get_feature(repo):
+        return repo.features & bit != 0
+
+    def set_feature(repo, value):
+        repo.features = repo.features | bit if value else repo.features & ~bit
+
+    return property(get_feature, set_feature)
+
 
 class Repo(object):
     """ A GitHub repository. """
 
-    def __init__(self, repo_name):
+    __slots__ = ("full_name", "uri", "features", "client", "failed", "failed_permanently", "failures", "discussions",
+                 "known_discussions", "unchanged_discussions", "input_names", "redirected_to")
+
+    # features are stored in one bitmask
+    has_code = _feature_property("Code")
+    has_issues = _feature_property("Issues")
+    has_pull_requests = _feature_property("Pull requests")
+    has_discussions = _feature_property("Discussions")
+    has_actions = _feature_property("Actions")
+    has_projects = _feature_property("Projects")
+    has_wiki = _feature_property("Wiki")
+    has_security = _feature_property("Security")
+    has_insights = _feature_property("Insights")
+
+    def __init__(self, repo_name, client):
         self.full_name = str(repo_name)
-        self.uri = "https://github.com/" + self.full_name
+        self.uri = github.GITHUB_URL + "/" + self.full_name
 
-        # features
-        self.has_code = False
-        self.has_issues = False
-        self.has_pull_requests = False
-        self.has_discussions = False
-        self.has_actions = False
-        self.has_projects = False
-        self.has_wiki = False
-        self.has_security = False
-        self.has_insights = False
+        # bitmask of the available features (see FEATURE_BITS)
+        self.features = 0
 
-        # session for data retrieval
-        self.session = requests.Session()
+        # shared HTTP client for data retrieval
+        self.client = client
 
-        # count number of attempts
-        self.attempts = 0
+        # true if some data could not be retrieved (repo will be retried when resuming a run)
+        self.failed = False
+
+        # true if the repo failed because of a permanent error (e.g., 404), it is not retried in the same run
+        self.failed_permanently = False
+
+        # requests that could not be completed
+        self.failures = []
 
         # discussion in this repo
         self.discussions = []
 
+        # markers of the discussions retrieved by a previous run (URI -> marker), None if the run is not incremental
+        self.known_discussions = None
+
+        # number of discussions that have not changed since the previous run (not retrieved again)
+        self.unchanged_discussions = 0
+
+        # spellings of the repo name in the input file (e.g., case variants or the name before a rename)
+        self.input_names = [self.full_name]
+
+        # current name of the repo if GitHub redirected its pages (renamed or transferred repo)
+        self.redirected_to = None
+
     def get_column_values(self):
-        return [self.full_name, self.has_code, self.has_issues, self.has_pull_requests, self.has_discussions, self.has_actions,
-                self.has_projects, self.has_wiki, self.has_security, self.has_insights]
+        return [self.full_name] + [self.features & FEATURE_BITS[name] != 0 for name in FEATURES]
 
     @classmethod
     def get_column_names(cls):
         return ["repo_name", "has_code", "has_issues", "has_pull_requests", "has_discussions", "has_actions",
                 "has_projects", "has_wiki", "has_security", "has_insights"]
 
-    def get_discussion_rows(self):
-        rows = []
-        if len(self.discussions) == 0:
-            rows.append([self.full_name] + ["n/a"] * 9)
-        else:
-            for discussion in self.discussions:
-                rows.append(discussion.get_column_values())
-        return rows
+    @classmethod
+    def get_column_types(cls):
+        return ["string"] + ["bool"] * len(FEATURES)
+
+    def iter_repo_rows(self):
+        # the retrieved features are exported for each spelling of the repo name in the input file
+        values = self.get_column_values()
+        for input_name in self.input_names:
+            yield [input_name] + values[1:]
 
-    def get_post_rows(self):
-        rows = []
+    def iter_discussion_rows(self):
+        if len(self.discussions) == 0 and self.unchanged_discussions == 0:
+            yield [self.full_name] + ["n/a"] * 9
         for discussion in self.discussions:
-            for post in discussion.posts:
-                rows.append(post.get_column_values())
-        return rows
+            yield discussion.get_column_values()
+
+    def iter_post_rows(self):
+        for discussion in self.discussions:
+            yield from discussion.iter_post_rows()
 
     def __str__(self):
         return str(self.full_name)
 
-    def retrieve_features(self):
-        # deal with failing requests...
-        while self.all_features_false():
-            self._retrieve_features()
-            if self.attempts > 100:
-                logger.error("Reached 100 attempts, giving up.")
-                return
+    def retrieve_features(self, streaming=False):
+        """
+        :param streaming: Stop downloading the repo page once its navigation bar has been parsed.
+        """
+        # the URI changes once the redirect of a renamed repo has been seen
+        uri = self.uri
+        _, failure = self.client.retry_policy.execute(uri, lambda: self.client.get(uri, stream=streaming),
+                                                      lambda response: self._process_features(response, streaming))
+        if failure:
+            logger.error("Retrieving features failed for repo: %s", failure)
+            self.fail(failure)
 
-    def _retrieve_features(self):
-        delay_next_request()
-        self.attempts = self.attempts + 1
-        response = None
-        try:
-            # retrieve repo start page
-            response = self.session.get(self.uri)
-        except ConnectionError:
-            logger.error("An error occurred while accessing repo: " + str(self))
-
-        if response and response.ok:
-            logger.info("Successfully accessed repo: " + str(self))
-            tree = html.fromstring(response.content)
-            items = tree.xpath('//ul[contains(@class, "UnderlineNav-body")]/li')
-            for item in items:
-                feature = item.xpath('a/span/text()')
-                self.process_feature(feature)
-            if self.all_features_false():
-                logger.error("Feature retrieval failed, trying again...")
-            else:
-                logger.info("Successfully retrieved features.")
+    def _process_features(self, response, streaming=False):
+        logger.info("Successfully accessed repo: %s", self)
+        self._check_redirect(response)
+        if streaming:
+            try:
+                features, bytes_read = parse_features_streaming(response.iter_content(FEATURES_CHUNK_SIZE))
+            except OSError:
+                # the transport errors of the requests package are subclasses of OSError
+                logger.error("An error occurred while reading repo: %s", self)
+                return False
+            finally:
+                # the rest of the page is not downloaded
+                response.close()
+            metrics.increment("bytes_downloaded", bytes_read)
         else:
-            logger.error("An error occurred while accessing repo: " + str(self))
+            page = Page.from_response(response)
+            bytes_read = len(page.content)
+            page.parse()
+            features = page.get_features()
+        metrics.increment("repo_page_bytes", bytes_read)
+
+        self.features = 0
+        with metrics.timer("extract"):
+            for feature in features:
+                self.process_feature(feature)
+        if self.all_features_false():
+            # GitHub occasionally responds with incomplete pages
+            logger.error("No features found for repo: %s", self)
+            return False
+        logger.info("Successfully retrieved features (%s KB downloaded).", round(bytes_read / 1024, 1))
+        return True
+
+    def _check_redirect(self, response):
+        # GitHub redirects the pages of renamed and transferred repos to their new name
+        path = urlsplit(str(response.url)).path.strip("/").split("/")
+        if len(path) >= 2 and path[0] + "/" + path[1] != self.full_name:
+            self.redirected_to = path[0] + "/" + path[1]
+            # later requests go to the new name directly instead of through the redirect
+            self.uri = github.GITHUB_URL + "/" + self.redirected_to
+
+    def fail(self, failure):
+        """
+        Mark the repo as failed because of a request that could not be completed.
+        """
+        self.failed = True
+        self.failed_permanently = self.failed_permanently or failure.permanent
+        self.failures.append(failure)
 
     def process_feature(self, feature):
         # feature can be either be the name of the feature or the name plus a number
@@ -103,68 +183,224 @@ class Repo(object):
         if len(feature) == 1 or len(feature) == 2:
             feature_name = str(feature[0])
         else:
-            logger.error("Unknown feature: " + str(feature))
-
-        if feature_name == "Code":
-            self.has_code = True
-        elif feature_name == "Issues":
-            self.has_issues = True
-        elif feature_name == "Pull requests":
-            self.has_pull_requests = True
-        elif feature_name == "Discussions":
-            self.has_discussions = True
-        elif feature_name == "Actions":
-            self.has_actions = True
-        elif feature_name == "Projects":
-            self.has_projects = True
-        elif feature_name == "Wiki":
-            self.has_wiki = True
-        elif feature_name == "Security":
-            self.has_security = True
-        elif feature_name == "Insights":
-            self.has_insights = True
+            logger.error("Unknown feature: %s", feature)
+
+        if feature_name in FEATURE_BITS:
+            self.features = self.features | FEATURE_BITS[feature_name]
         else:
-            logger.error("Unknown feature: " + feature_name)
+            logger.error("Unknown feature: %s", feature_name)
 
     def all_features_false(self):
-        return (self.has_code or self.has_issues or self.has_pull_requests or self.has_discussions or self.has_actions or \
-                self.has_projects or self.has_wiki or self.has_security or self.has_insights) is False
+        return self.features == 0
 
-    def retrieve_discussions(self, discussion_posts):
-        delay_next_request()
-        response = None
-        page = 1
+    def retrieve_discussions(self, discussion_posts, streaming=False, parse_pool=None, prefetch=0):
+        """
+        :param prefetch: Number of listing pages that are retrieved concurrently ahead of the current page, once the
+                         number of pages is known from the pagination of a listing page.
+        """
+        prefetched = {}
+        executor = None
         try:
-            # retrieve first discussion page
-            response = self._retrieve_discussions_page(page)
-        except ConnectionError:
-            logger.error("An error occurred while accessing discussions page of repo: " + str(self))
-
-        while response and response.ok:
-            if page > 1 and self.reached_last_page(response):
-                break
-            logger.info("Successfully accessed discussions page " + str(page) + " of repo: " + str(self))
-            tree = html.fromstring(response.content)
-            links = tree.xpath('//a[contains(@data-hovercard-type, "discussion")]/@href')
-            if len(links) > 0:
-                logger.info(str(len(links)) + " discussions found on page: " + str(page))
-            else:
-                break
-            for link in links:
-                discussion = Discussion(self, link)
-                self.discussions.append(discussion)
-                if discussion_posts:
-                    discussion.retrieve_discussion_posts(self.session)
-            page = page + 1
-            response = self._retrieve_discussions_page(page)
-
-        logger.info("No discussions found on page: " + str(page))
-
-    def _retrieve_discussions_page(self, page):
-        return self.session.get(self.uri + "/discussions?page=" + str(page))
+            page = 1
+            while True:
+                future = prefetched.pop(page, None)
+                response, failure = future.result() if future else self._get_listing_page(page)
+                if failure:
+                    self._handle_listing_failure(failure, page)
+                    return
+                links, total_pages = self._get_discussion_links(response, page)
+                if len(links) == 0:
+                    logger.info("No discussions found on page: %s", page)
+                    return
+                changed_links = self._get_changed_links(links, page)
+                if self._should_prefetch(prefetch, total_pages, links, changed_links):
+                    if executor is None:
+                        executor = ThreadPoolExecutor(max_workers=prefetch)
+                    for next_page in range(page + 1, min(total_pages, page + prefetch) + 1):
+                        if next_page not in prefetched:
+                            prefetched[next_page] = executor.submit(self._get_listing_page, next_page)
+                for link, marker in changed_links:
+                    discussion = Discussion(self.full_name, link, marker)
+                    if discussion_posts:
+                        discussion.retrieve_discussion_posts(self.client, streaming, parse_pool)
+                    self._add_discussion(discussion)
+                if len(changed_links) == 0 or self.is_last_page(page, total_pages, links):
+                    return
+                page = page + 1
+        finally:
+            if executor:
+                # prefetched pages that are not needed anymore (e.g., after a failure) are not retrieved
+                for future in prefetched.values():
+                    future.cancel()
+                executor.shutdown()
+
+    async def retrieve_discussions_async(self, discussion_posts, async_client, streaming=False, parse_pool=None,
+                                         prefetch=0):
+        """
+        Like retrieve_discussions(), but the pages are retrieved with the asyncio client: the listing pages feed
+        the discussions into a queue from which a bounded number of fetchers retrieve the discussion posts
+        concurrently. Pages are parsed in the thread pool of the client.
+        """
+        queue = asyncio.Queue(maxsize=2 * async_client.concurrency)
+        fetchers = []
+        if discussion_posts:
+            fetchers = [asyncio.ensure_future(self._fetch_discussion_posts(queue, async_client, streaming, parse_pool))
+                        for _ in range(async_client.concurrency)]
+
+        discussions = []
+        prefetched = {}
+        completed = False
+        try:
+            page = 1
+            while True:
+                task = prefetched.pop(page, None)
+                response, failure = await (task if task else self._get_listing_page_async(page, async_client))
+                if failure:
+                    self._handle_listing_failure(failure, page)
+                    break
+                links, total_pages = await async_client.run_in_executor(self._get_discussion_links, response, page)
+                if len(links) == 0:
+                    logger.info("No discussions found on page: %s", page)
+                    break
+                changed_links = self._get_changed_links(links, page)
+                if self._should_prefetch(prefetch, total_pages, links, changed_links):
+                    for next_page in range(page + 1, min(total_pages, page + prefetch) + 1):
+                        if next_page not in prefetched:
+                            prefetched[next_page] = asyncio.ensure_future(
+                                self._get_listing_page_async(next_page, async_client))
+                for link, marker in changed_links:
+                    discussion = Discussion(self.full_name, link, marker)
+                    discussions.append(discussion)
+                    if discussion_posts:
+                        await self._put_discussion(queue, discussion, fetchers)
+                if len(changed_links) == 0 or self.is_last_page(page, total_pages, links):
+                    break
+                page = page + 1
+            completed = True
+        finally:
+            for task in prefetched.values():
+                task.cancel()
+            await asyncio.gather(*prefetched.values(), return_exceptions=True)
+            if not completed:
+                # the listing or a fetcher failed, the remaining discussions are not retrieved
+                for fetcher in fetchers:
+                    fetcher.cancel()
+                await asyncio.gather(*fetchers, return_exceptions=True)
+        for _ in fetchers:
+            await self._put_discussion(queue, None, fetchers)
+        await asyncio.gather(*fetchers)
+
+        # discussions are added in the order of the listing pages
+        for discussion in discussions:
+            self._add_discussion(discussion)
+
+    def _get_listing_page(self, page):
+        """
+        :return: Tuple (response, failure) of a listing page.
+        """
+        uri = self._get_discussions_page_uri(page)
+        return self.client.retry_policy.execute(uri, lambda: self.client.get(uri))
+
+    async def _get_listing_page_async(self, page, async_client):
+        uri = self._get_discussions_page_uri(page)
+        return await async_client.retry_policy.execute_async(uri, lambda: async_client.get(uri))
+
+    @staticmethod
+    async def _put_discussion(queue, discussion, fetchers):
+        """
+        Put a discussion (or None to stop a fetcher) into the queue of the fetchers. Nothing drains the queue
+        anymore once a fetcher has failed, its exception is raised instead of waiting for a free slot.
+        """
+        put = asyncio.ensure_future(queue.put(discussion))
+        while True:
+            for fetcher in fetchers:
+                if fetcher.done() and not fetcher.cancelled() and fetcher.exception() is not None:
+                    put.cancel()
+                    raise fetcher.exception()
+            if put.done():
+                return
+            await asyncio.wait([put] + [fetcher for fetcher in fetchers if not fetcher.done()],
+                               return_when=asyncio.FIRST_COMPLETED)
+
+    @staticmethod
+    async def _fetch_discussion_posts(queue, async_client, streaming, parse_pool):
+        while True:
+            discussion = await queue.get()
+            if discussion is None:
+                return
+            await discussion.retrieve_discussion_posts_async(async_client, streaming, parse_pool)
+
+    def _get_discussion_links(self, response, page):
+        """
+        :return: Tuple (links, total_pages) with tuples (link, marker) of the discussions on a listing page (an empty
+                 list after the last page) and the number of pages (None if the listing has no pagination).
+        """
+        # parse each listing page once and share the tree between all extractors
+        listing_page = Page.from_response(response)
+        if page == 1:
+            self._check_redirect(response)
+        if page > 1 and self.reached_last_page(listing_page):
+            return [], None
+        logger.info("Successfully accessed discussions page %s of repo: %s", page, self)
+        links = listing_page.get_discussion_links()
+        if len(links) > 0:
+            logger.info("%s discussions found on page: %s", len(links), page)
+        # markers are recorded in every run, so that the next run can be incremental
+        markers = listing_page.get_discussion_markers()
+        return [(link, markers.get(link)) for link in links], listing_page.get_total_pages()
+
+    def _get_changed_links(self, links, page):
+        """
+        In incremental runs, skip discussions whose marker has not changed since the previous run.
+        The listing is ordered by the latest activity, so once a whole page is unchanged, all following pages
+        are unchanged as well.
+        :return: Tuples (link, marker) of new or changed discussions.
+        """
+        if self.known_discussions is None:
+            return links
+        changed_links = [(link, marker) for link, marker in links
+                         if marker is None or self.known_discussions.get(github.GITHUB_URL + link) != marker]
+        self.unchanged_discussions = self.unchanged_discussions + len(links) - len(changed_links)
+        metrics.increment("discussions_unchanged", len(links) - len(changed_links))
+        if len(changed_links) == 0:
+            logger.info("No changes since the previous run on page %s, skipping the remaining pages of repo: %s",
+                        page, self)
+        return changed_links
+
+    @staticmethod
+    def _should_prefetch(prefetch, total_pages, links, changed_links):
+        # incremental runs stop at the first unchanged page, following pages are only retrieved ahead as long as
+        # all discussions on the current page are new or changed
+        return prefetch > 0 and total_pages and len(changed_links) == len(links)
+
+    def _handle_listing_failure(self, failure, page):
+        if failure.status_code == 404:
+            # 404 means that the repo does not have discussions
+            logger.info("No discussions found on page: %s", page)
+        else:
+            logger.error("Retrieving discussions failed for repo: %s", failure)
+            self.fail(failure)
+
+    def _add_discussion(self, discussion):
+        if discussion.failure and discussion.failure.permanent:
+            # the discussion has been deleted or moved in the meantime, skip it
+            self.failures.append(discussion.failure)
+            return
+        if discussion.failed:
+            self.fail(discussion.failure)
+        self.discussions.append(discussion)
+
+    def _get_discussions_page_uri(self, page):
+        return self.uri + "/discussions?page=" + str(page)
+
+    @staticmethod
+    def reached_last_page(listing_page):
+        return listing_page.is_blank_slate()
 
     @staticmethod
-    def reached_last_page(response):
-        tree = html.fromstring(response.content)
-        h3 = tree.xpath('//div[contains(@class, "blankslate")]/h3/text()')
-        return h3 and str(h3).strip() == "There aren't any discussions."
+    def is_last_page(page, total_pages, links):
+        # GitHub only shows the pagination if there is more than one page, so the blank slate after the last page
+        # does not need to be requested
+        if total_pages is not None:
+            return page >= total_pages
+        return len(links) < DISCUSSIONS_PER_PAGE
@@ -1,13 +1,22 @@
-import codecs
 import csv
 import logging
 import os
-import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from github.discussion import Discussion
+from github.exports import get_blob_store_path, get_export_path, get_state_store_path
 from github.post import Post
 from github.repo import Repo
-from util.exceptions import IllegalArgumentError
+from github.shards import get_shard, get_shard_filename
+from util.blob_store import BlobStore
+from util.compression import open_text_input
+from util.exceptions import IllegalArgumentError, IllegalConfigurationError
+from util.metrics import metrics
+from util.retry import Failure
+from util.state_store import StateStore, DONE, FAILED
+from util.writers import CsvWriter, create_writer
 
 logger = logging.getLogger("github-retriever_logger")
 
@@ -15,22 +24,115 @@ logger = logging.getLogger("github-retriever_logger")
 class RepoList(object):
     """ List of GitHub repos. """
 
-    def __init__(self, input_file, output_dir, delimiter):
-        self.filename = ""
+    def __init__(self, input_file, output_dir, delimiter, client, resume=False, retry_rounds=1, async_client=None,
+                 parse_pool=None, shard_index=0, shard_count=1, file_format="csv", previous_run=None,
+                 stream_features=False, listing_prefetch=0, compression=None, compression_level=None,
+                 blob_store=False):
         self.input_file = input_file
+        # each shard of a distributed run has its own export files
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.filename = get_shard_filename(os.path.basename(input_file), shard_index, shard_count)
         self.output_dir = output_dir
         self.delimiter = delimiter
+        # format of the export files (see util.writers.FORMATS) and their optional compression (gz or zst)
+        self.file_format = file_format
+        self.compression = compression
+        self.compression_level = compression_level
+        # write the contents of posts to a content-addressed blob store and only their hashes to the posts export
+        self.blob_store = blob_store
+        self.client = client
+        # optional asyncio client for retrieving discussions
+        self.async_client = async_client
+        # optional pool of worker processes for parsing discussions
+        self.parse_pool = parse_pool
+        self.resume = resume
+        # progress database of a previous run, only new or changed discussions are retrieved if it is set
+        self.previous_run = previous_run
+        # stop downloading repo pages once their navigation bar has been parsed
+        self.stream_features = stream_features
+        # number of discussion listing pages retrieved ahead of the current one
+        self.listing_prefetch = listing_prefetch
         self.repos = []
 
+        # progress of the run, opened when the input file is read
+        self.state_store = None
+
+        # number of repos at the beginning of self.repos that have been processed completely / exported
+        self.completed = 0
+        self.exported = 0
+
+        # states of exported repos and discussions that have not been committed to the state store yet
+        self.pending_repo_states = []
+        self.pending_discussion_states = []
+        self.pending_aliases = []
+
+        # open export files
+        self.writers = {}
+
+        # names and input names of repos that failed because of transient errors, they are retried at the end of
+        # the run
+        self.retry_rounds = retry_rounds
+        self.retry_round = 0
+        self.deferred = []
+
+        # rows describing requests that failed finally
+        self.failures = []
+
     def read_from_csv(self):
         """
         Read repo names from a CSV file (header required).
         """
+        self.repos = list(self.iter_repos())
+        logger.info("%s repos have been imported.", len(self.repos))
 
-        # read CSV as UTF-8 encoded file (see also http://stackoverflow.com/a/844443)
-        with codecs.open(self.input_file, encoding='utf8') as fp:
-            logger.info("Reading repos from " + self.input_file + "...")
-
+    def iter_repos(self):
+        """
+        Lazily read repo names from a CSV file (header required).
+        Names that refer to the same repo (duplicates, case variants, and names of renamed repos recorded in the
+        alias map) are canonicalized in a first pass over the file, so that each repo is only retrieved once.
+        When resuming a run, repos that have already been completed are skipped.
+        """
+        self._open_state_store()
+        done = set()
+        if self.resume:
+            done = set(repo_name.lower() for repo_name in self.state_store.get_repo_names(DONE))
+            logger.info("Resuming run, %s repos have already been completed.", len(done))
+        aliases = self.state_store.get_aliases()
+        logger.info("Reading repos from %s...", self.input_file)
+
+        # first spelling of each repo and further spellings of repos that are listed more than once
+        first_names = {}
+        variants = {}
+        duplicates = 0
+        for repo_name in self._read_repo_names():
+            # repos are assigned to shards by their input name, as the alias map only exists in the progress
+            # database of the shard that has seen the redirect
+            if self.shard_count > 1 and get_shard(repo_name, self.shard_count) != self.shard_index:
+                continue
+            key = aliases.get(repo_name.lower(), repo_name).lower()
+            first_name = first_names.get(key)
+            if first_name is None:
+                first_names[key] = repo_name
+                continue
+            duplicates = duplicates + 1
+            if repo_name != first_name and repo_name not in variants.setdefault(key, []):
+                variants[key].append(repo_name)
+        if duplicates > 0:
+            logger.info("%s input rows refer to repos that are listed before, they are retrieved only once.",
+                        duplicates)
+
+        for repo_name in self._read_repo_names():
+            key = aliases.get(repo_name.lower(), repo_name).lower()
+            first_name = first_names.pop(key, None)
+            if first_name is None or key in done:
+                continue
+            yield self._create_repo(aliases.get(first_name.lower(), first_name),
+                                    [first_name] + variants.pop(key, []))
+
+    def _read_repo_names(self):
+        # read CSV as UTF-8 encoded file, which is decompressed if its name ends with .gz or .zst
+        with open_text_input(self.input_file) as fp:
             reader = csv.reader(fp, delimiter=self.delimiter)
 
             # read header
@@ -43,155 +145,309 @@ class RepoList(object):
             # read CSV file
             for row in reader:
                 if row:
-                    self.repos.append(
-                        Repo(row[repo_name_index])
-                    )
+                    yield row[repo_name_index].strip()
                 else:
                     raise IllegalArgumentError("Wrong CSV format.")
 
-        self.filename = os.path.basename(self.input_file)
-        logger.info(str(len(self.repos)) + " repos have been imported.")
-
-    def retrieve_data(self, backup_frequency, features, discussions, discussion_posts):
-        n = len(self.repos)
-        for index, repo in enumerate(self.repos):
-            if (index+1) % 50 == 0:
-                # wait every 50th request for 5 seconds to prevent getting blocked
-                time.sleep(5)
-            if index > 0 and (index + 1) % backup_frequency == 0:
-                progress = round((index + 1)/n*100, 2)
-                logger.info("Reached {0}%, backing up retrieved information...".format(progress))
-                if features:
-                    self.write_repos_to_csv()
-                if discussions:
-                    self.write_discussions_to_csv()
-                if discussion_posts:
-                    self.write_discussion_posts_to_csv()
-            if features:
-                repo.retrieve_features()
-            if discussions:
-                repo.retrieve_discussions(discussion_posts)
-
-    def write_repos_to_csv(self):
-        """
-        Export repos along with retrieved features to a CSV file.
-        """
-
-        if len(self.repos) == 0:
+    def _open_state_store(self):
+        if self.state_store is None:
+            file_path = get_state_store_path(self.output_dir, self.filename)
+            if self.previous_run and os.path.abspath(self.previous_run) == os.path.abspath(file_path):
+                raise IllegalConfigurationError("Incremental runs require a different output directory than the "
+                                                "previous run.")
+            self.state_store = StateStore(file_path, self.resume)
+            if self.previous_run:
+                # the markers of unchanged discussions are carried over, so that the next run can build on this one
+                count = self.state_store.import_previous_run(self.previous_run)
+                logger.info("Incremental run, %s discussions have been imported from %s.", count, self.previous_run)
+
+    def _create_repo(self, repo_name, input_names):
+        repo = Repo(repo_name, self.client)
+        repo.input_names = input_names
+        if self.previous_run:
+            repo.known_discussions = self.state_store.get_discussion_markers(repo.full_name)
+        return repo
+
+    def retrieve_data(self, backup_frequency, features, discussions, discussion_posts, workers=1, streaming=False,
+                      pipeline=False):
+        if pipeline:
+            self._retrieve_data_pipelined(backup_frequency, features, discussions, discussion_posts, workers,
+                                          streaming)
+        elif workers > 1:
+            self._retrieve_data_concurrently(backup_frequency, features, discussions, discussion_posts, workers,
+                                             streaming)
+        else:
+            for index, repo in enumerate(self.repos):
+                self._retrieve_repo_data(repo, features, discussions, discussion_posts, streaming)
+                self.completed = index + 1
+                self._backup_if_necessary(backup_frequency, features, discussions, discussion_posts)
+
+        # failed repos are known once all repos have been exported
+        self.export(features, discussions, discussion_posts)
+        self._retry_deferred(features, discussions, discussion_posts, workers, streaming)
+        self._write_failures()
+
+    def _retrieve_data_concurrently(self, backup_frequency, features, discussions, discussion_posts, workers,
+                                    streaming):
+        logger.info("Retrieving data with %s workers...", workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._retrieve_repo_data, repo, features, discussions, discussion_posts, streaming)
+                for repo in self.repos
+            ]
+            try:
+                # consume results in input order so that backups only contain completed repos
+                for index, future in enumerate(futures):
+                    future.result()
+                    self.completed = index + 1
+                    self._backup_if_necessary(backup_frequency, features, discussions, discussion_posts)
+            except BaseException:
+                # do not start the remaining repos if the run is interrupted
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    def _retrieve_data_pipelined(self, backup_frequency, features, discussions, discussion_posts, workers,
+                                 streaming):
+        """
+        Read, retrieve, and export repos one after another without keeping them in memory.
+        Repos are read lazily from the input file, at most two repos per worker are in flight, and each repo is
+        written to the export files as soon as it (and all repos before it) have been completed.
+        """
+        logger.info("Retrieving data in pipeline mode with %s worker(s)...", workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = deque()
+            try:
+                for repo in self.iter_repos():
+                    in_flight.append(executor.submit(self._retrieve_repo_data, repo, features, discussions,
+                                                     discussion_posts, streaming))
+                    if len(in_flight) >= 2 * workers:
+                        self._complete_pipelined(in_flight.popleft().result(), backup_frequency, features,
+                                                 discussions, discussion_posts)
+                while in_flight:
+                    self._complete_pipelined(in_flight.popleft().result(), backup_frequency, features,
+                                             discussions, discussion_posts)
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    def _complete_pipelined(self, repo, backup_frequency, features, discussions, discussion_posts):
+        # export the repo right away, it is not referenced anymore afterwards
+        self._export_repo(repo, features, discussions, discussion_posts)
+        self.completed = self.completed + 1
+        self.exported = self.completed
+        if self.completed % backup_frequency == 0:
+            logger.info("Processed %s repos, backing up retrieved information...", self.completed)
+            self._checkpoint()
+
+    def _retry_deferred(self, features, discussions, discussion_posts, workers, streaming):
+        """
+        Retry repos that failed because of transient errors (e.g., server errors) after all other repos have been
+        processed, so that a temporary outage does not stall the run.
+        Retried repos are exported after all other repos.
+        """
+        while self.deferred and self.retry_round < self.retry_rounds:
+            self.retry_round = self.retry_round + 1
+            repos = [self._create_repo(repo_name, input_names) for repo_name, input_names in self.deferred]
+            self.deferred = []
+            logger.info("Retrying %s failed repo(s) (round %s)...", len(repos), self.retry_round)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                try:
+                    for repo in executor.map(lambda deferred_repo: self._retrieve_repo_data(
+                            deferred_repo, features, discussions, discussion_posts, streaming), repos):
+                        self._export_repo(repo, features, discussions, discussion_posts)
+                except BaseException:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+            self._checkpoint()
+
+    def _write_failures(self):
+        """
+        Write all requests that failed finally in this run to a separate file.
+        """
+        if len(self.failures) == 0:
+            return
+        file_path = get_export_path(self.output_dir, self.filename, "failures", "csv", self.compression)
+        writer = CsvWriter(file_path, Failure.get_column_names(), self.delimiter,
+                           compression_level=self.compression_level)
+        for row in self.failures:
+            writer.write_row(row)
+        writer.close()
+        logger.error("%s request(s) failed finally, see %s.", writer.count, file_path)
+
+    def _backup_if_necessary(self, backup_frequency, features, discussions, discussion_posts):
+        # the remaining repos are exported after retrieve_data has finished
+        if self.completed % backup_frequency == 0 and self.completed < len(self.repos):
+            progress = round(self.completed/len(self.repos)*100, 2)
+            logger.info("Reached %s%%, backing up retrieved information...", progress)
+            self.export(features, discussions, discussion_posts)
+
+    def _retrieve_repo_data(self, repo, features, discussions, discussion_posts, streaming):
+        if features:
+            repo.retrieve_features(self.stream_features)
+        # repos whose features could not be retrieved are retried completely
+        if discussions and not repo.failed:
+            if self.async_client:
+                self.async_client.run(repo.retrieve_discussions_async(discussion_posts, self.async_client, streaming,
+                                                                      self.parse_pool, self.listing_prefetch))
+            else:
+                repo.retrieve_discussions(discussion_posts, streaming, self.parse_pool, self.listing_prefetch)
+        return repo
+
+    def export(self, features, discussions, discussion_posts):
+        """
+        Export all completed repos that have not been exported yet and commit their state,
+        so that the run can be resumed from here.
+        """
+        if self.completed == 0 and len(self.writers) == 0:
             logger.info("Nothing to export.")
             return
 
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-
-        file_path = os.path.join(self.output_dir, self.filename)
-
-        # write paper list to UTF8-encoded CSV file (see also http://stackoverflow.com/a/844443)
-        with codecs.open(file_path, 'w', encoding='utf8') as fp:
-            logger.info('Exporting repos to ' + file_path + '...')
-            writer = csv.writer(fp, delimiter=self.delimiter)
-
-            column_names = Repo.get_column_names()
-
-            # write header of CSV file
-            writer.writerow(column_names)
-
-            count = 0
-            for repo in self.repos:
+        for repo in self.repos[self.exported:self.completed]:
+            self._export_repo(repo, features, discussions, discussion_posts)
+        self.exported = self.completed
+        self._checkpoint()
+
+    def _export_repo(self, repo, features, discussions, discussion_posts):
+        metrics.increment("repos_completed")
+        if repo.failed:
+            metrics.increment("repos_failed")
+        with metrics.timer("write"):
+            self._write_repo(repo, features, discussions, discussion_posts)
+
+        self.pending_repo_states.append((repo.full_name, FAILED if repo.failed else DONE))
+        if repo.redirected_to and not repo.failed:
+            # resumed runs look up repos by their current name
+            self.pending_repo_states.append((repo.redirected_to, DONE))
+        if repo.failed and not repo.failed_permanently and self.retry_round < self.retry_rounds:
+            self.deferred.append((repo.full_name, repo.input_names))
+        else:
+            self.failures.extend(failure.get_column_values(repo.full_name) for failure in repo.failures)
+        for discussion in repo.discussions:
+            # discussions of failed repos have not been exported and must not be skipped by incremental runs,
+            # they are recorded under the current name of the repo, which incremental runs look them up with
+            self.pending_discussion_states.append(
+                (discussion.uri, repo.redirected_to or repo.full_name,
+                 FAILED if repo.failed or discussion.failed else DONE, discussion.marker))
+        if repo.redirected_to:
+            # the next run retrieves the repo by its current name
+            logger.info("Repo %s has moved to %s.", repo.full_name, repo.redirected_to)
+            self.pending_aliases.extend((input_name.lower(), repo.redirected_to)
+                                        for input_name in set(repo.input_names + [repo.full_name]))
+
+    def _write_repo(self, repo, features, discussions, discussion_posts):
+        for name, file_path, column_names, column_types, get_rows in self._get_exports(features, discussions,
+                                                                                       discussion_posts):
+            writer = self._get_writer(name, file_path, column_names, column_types)
+            if repo.failed:
+                # failed repos are not exported so that they can be retried without duplicating rows
+                continue
+            for row in get_rows(repo):
                 try:
-                    row = repo.get_column_values()
                     if len(row) == len(column_names):
-                        writer.writerow(row)
-                        count = count + 1
+                        writer.write_row(row)
                     else:
                         raise IllegalArgumentError(
-                            str(len(column_names) - len(row)) + " parameter(s) is/are missing for repo "
-                            + repo.full_name)
+                            str(len(column_names) - len(row)) + " parameter(s) is/are missing for " + name
+                            + " in repo " + repo.full_name)
                 except UnicodeEncodeError:
-                    logger.error("Encoding error while writing data for repo: " + repo.full_name)
-
-            logger.info(str(count) + ' repo(s) has/have been exported.')
-
-    def write_discussions_to_csv(self):
+                    logger.error("Encoding error while writing %s in repo: %s", name, repo.full_name)
+
+    def _get_exports(self, features, discussions, discussion_posts):
+        # name, file path, column names and types, and row generator of each enabled export
+        exports = []
+        if features:
+            exports.append(("repos", get_export_path(self.output_dir, self.filename, "repos", self.file_format,
+                                                     self.compression),
+                            Repo.get_column_names(), Repo.get_column_types(),
+                            lambda repo: repo.iter_repo_rows()))
+        if discussions:
+            exports.append(("discussions",
+                            get_export_path(self.output_dir, self.filename, "discussions", self.file_format,
+                                            self.compression),
+                            Discussion.get_column_names(), Discussion.get_column_types(),
+                            lambda repo: repo.iter_discussion_rows()))
+        if discussion_posts:
+            column_names = Post.get_column_names()
+            if self.blob_store:
+                column_names = column_names[:-1] + ["content_hash"]
+            exports.append(("discussion posts",
+                            get_export_path(self.output_dir, self.filename, "discussion posts", self.file_format,
+                                            self.compression),
+                            column_names, Post.get_column_types(),
+                            lambda repo: self._store_contents(repo.iter_post_rows()) if self.blob_store
+                            else repo.iter_post_rows()))
+        return exports
+
+    def _store_contents(self, rows):
+        # replace the content of each post (the last column) with its hash in the blob store
+        blob_store = self._get_blob_store()
+        for row in rows:
+            if row[-1] is not None:
+                row[-1] = blob_store.put(row[-1])
+            yield row
+
+    def _get_blob_store(self):
+        blob_store = self.writers.get("post contents")
+        if blob_store is None:
+            # like the export files, the blob store is committed at checkpoints and continued when resuming a run
+            directory = get_blob_store_path(self.output_dir, self.filename)
+            logger.info("Storing post contents in %s...", directory)
+            resume_offset, resume_count = self._get_resume_state("post contents", directory)
+            blob_store = BlobStore(directory, resume_offset, resume_count, self.compression_level)
+            self.writers["post contents"] = blob_store
+        return blob_store
+
+    def _get_writer(self, name, file_path, column_names, column_types):
+        writer = self.writers.get(name)
+        if writer is None:
+            # the file is created on the first export (or continued when resuming a run) and kept open
+            # until close() is called
+            logger.info("Exporting %s to %s...", name, file_path)
+            resume_offset, resume_count = self._get_resume_state(name, file_path)
+            writer = create_writer(self.file_format, file_path, column_names, column_types, self.delimiter,
+                                   resume_offset, resume_count, self.compression_level)
+            self.writers[name] = writer
+        return writer
+
+    def _get_resume_state(self, name, file_path):
         """
-        Export discussions retrieved from repos to a CSV file.
+        :return: Tuple (offset, count) of an export at the last checkpoint, offset is None if it is not resumed.
         """
-
-        # TODO: Refactor list operations (see similar code above and below)
-
-        if len(self.repos) == 0:
-            logger.info("Nothing to export.")
-            return
-
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-
-        file_path = os.path.join(self.output_dir, self.filename.replace(".csv", "_discussions.csv"))
-
-        # write discussions to UTF8-encoded CSV file (see also http://stackoverflow.com/a/844443)
-        with codecs.open(file_path, 'w', encoding='utf8') as fp:
-            logger.info('Exporting discussions to ' + file_path + '...')
-            writer = csv.writer(fp, delimiter=self.delimiter)
-
-            column_names = Discussion.get_column_names()
-
-            # write header of CSV file
-            writer.writerow(column_names)
-
-            count = 0
-            for repo in self.repos:
-                rows = repo.get_discussion_rows()
-                for row in rows:
-                    try:
-                        if len(row) == len(column_names):
-                            writer.writerow(row)
-                            count = count + 1
-                        else:
-                            raise IllegalArgumentError(
-                                str(len(column_names) - len(row)) + " parameter(s) is/are missing for discussions"
-                                                                    " in repo " + repo.full_name)
-                    except UnicodeEncodeError:
-                        logger.error("Encoding error while writing discussions in repo: " + repo.full_name)
-
-            logger.info(str(count) + ' discussion(s) has/have been exported.')
-
-    def write_discussion_posts_to_csv(self):
+        export_state = self.state_store.get_export(name) if self.resume and self.state_store else None
+        # the output directory may be given differently (e.g., relative or through a link) when resuming
+        if export_state and os.path.realpath(export_state[0]) == os.path.realpath(file_path):
+            return export_state[1], export_state[2]
+        return None, 0
+
+    def _checkpoint(self):
+        # flush all export files, then commit the states of the exported repos together with the file offsets
+        exports = []
+        with metrics.timer("checkpoint"):
+            for name, writer in self.writers.items():
+                exports.append((name, os.path.realpath(writer.file_path), writer.checkpoint(), writer.count))
+                logger.info("%s %s have been exported to %s.", writer.count, name, writer.file_path)
+
+        failed = sum(1 for _, status in self.pending_repo_states if status == FAILED)
+        if self.state_store:
+            self.state_store.commit(self.pending_repo_states, self.pending_discussion_states, exports,
+                                    self.pending_aliases)
+        self.pending_repo_states = []
+        self.pending_discussion_states = []
+        self.pending_aliases = []
+        logger.info("Progress: %s", metrics.summary())
+
+        if failed > 0:
+            logger.error("%s repo(s) could not be retrieved completely and have not been exported, %s", failed,
+                         "they are retried at the end of the run." if self.deferred
+                         else "run again with --resume True to retry them.")
+
+    def close(self):
         """
-        Export discussion posts retrieved from repos to a CSV file.
+        Close all export files and the state store.
         """
-
-        if len(self.repos) == 0:
-            logger.info("Nothing to export.")
-            return
-
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-
-        file_path = os.path.join(self.output_dir, self.filename.replace(".csv", "_discussion_posts.csv"))
-
-        # write discussions to UTF8-encoded CSV file (see also http://stackoverflow.com/a/844443)
-        with codecs.open(file_path, 'w', encoding='utf8') as fp:
-            logger.info('Exporting discussion posts to ' + file_path + '...')
-            writer = csv.writer(fp, delimiter=self.delimiter)
-
-            column_names = Post.get_column_names()
-
-            # write header of CSV file
-            writer.writerow(column_names)
-
-            count = 0
-            for repo in self.repos:
-                rows = repo.get_post_rows()
-                for row in rows:
-                    try:
-                        if len(row) == len(column_names):
-                            writer.writerow(row)
-                            count = count + 1
-                        else:
-                            raise IllegalArgumentError(
-                                str(len(column_names) - len(row)) + " parameter(s) is/are missing for discussion post"
-                                                                    " in repo " + repo.full_name)
-                    except UnicodeEncodeError:
-                        logger.error("Encoding error while writing discussion posts in repo: " + repo.full_name)
-
-            logger.info(str(count) + ' discussion post(s) has/have been exported.')
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+        if self.state_store:
+            self.state_store.close()
+            self.state_store = None
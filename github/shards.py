@@ -0,0 +1,110 @@
+""" Distribution of repos to the shards of a distributed run and merging of their export files. """
+
+import csv
+import hashlib
+import logging
+import os
+
+from github.exports import EXPORT_SUFFIXES, get_export_path, get_state_store_path
+from util.compression import open_text_input, strip_compression_extension
+from util.state_store import StateStore
+from util.writers import CsvWriter
+
+logger = logging.getLogger("github-retriever_logger")
+
+# number of leading columns identifying a row of an export, None if the whole row is compared
+KEY_COLUMNS = {
+    "repos": 1,
+    "discussions": 2,
+    "discussion posts": None,
+    "failures": None
+}
+
+
+def get_shard(repo_name, shard_count):
+    """
+    Assign a repo to a shard. The assignment only depends on the (case-insensitive) repo name, so that it is the
+    same on every machine and in every run (unlike the built-in hash(), which is randomized per process).
+    :return: Index of the shard (between 0 and shard_count - 1).
+    """
+    digest = hashlib.md5(repo_name.strip().lower().encode('utf8')).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def get_shard_filename(filename, shard_index, shard_count):
+    """
+    :return: Name of the input file used for the export files of a shard.
+    """
+    if shard_count <= 1:
+        return filename
+    name, extension = os.path.splitext(strip_compression_extension(filename))
+    return name + "_shard-" + str(shard_index) + "-of-" + str(shard_count) + extension
+
+
+def merge_shards(input_file, output_dir, delimiter, shard_count, compression=None, compression_level=None):
+    """
+    Merge the export files of all shards of a distributed run into one set of export files without duplicates.
+    The export files (and progress databases) of all shards have to be copied to the output directory first.
+    If the progress database of a shard is available, only rows committed at its last checkpoint are merged.
+    :param input_file: Input file of the run.
+    :param output_dir: Directory containing the export files of all shards.
+    :param delimiter: Delimiter of the CSV files.
+    :param shard_count: Number of shards.
+    :param compression: Compression of the export files of the shards and of the merged files.
+    :param compression_level: Level of the compression of the merged files.
+    """
+    filename = os.path.basename(input_file)
+    for name in EXPORT_SUFFIXES:
+        merged_path = get_export_path(output_dir, filename, name, "csv", compression)
+        writer = None
+        keys = set()
+        duplicates = 0
+        for shard_index in range(shard_count):
+            shard_filename = get_shard_filename(filename, shard_index, shard_count)
+            file_path = get_export_path(output_dir, shard_filename, name, "csv", compression)
+            if not os.path.exists(file_path):
+                logger.info("No %s found for shard %s: %s", name, shard_index, file_path)
+                continue
+
+            committed_rows = _get_committed_rows(output_dir, shard_filename, name)
+            with open_text_input(file_path) as fp:
+                reader = csv.reader(fp, delimiter=delimiter)
+                header = next(reader, None)
+                if header is None:
+                    continue
+                if writer is None:
+                    writer = CsvWriter(merged_path, header, delimiter, compression_level=compression_level)
+                for index, row in enumerate(reader):
+                    if committed_rows is not None and index >= committed_rows:
+                        logger.info("Skipping %s of shard %s written after its last checkpoint.", name, shard_index)
+                        break
+                    key = _get_key(name, row)
+                    if key in keys:
+                        duplicates = duplicates + 1
+                        continue
+                    keys.add(key)
+                    writer.write_row(row)
+
+        if writer:
+            writer.close()
+            logger.info("%s %s have been merged into %s (%s duplicates removed).", writer.count, name, merged_path,
+                        duplicates)
+
+
+def _get_committed_rows(output_dir, shard_filename, name):
+    # number of rows of an export committed at the last checkpoint of a shard (None if unknown)
+    state_store_path = get_state_store_path(output_dir, shard_filename)
+    if not os.path.exists(state_store_path):
+        return None
+    state_store = StateStore(state_store_path, resume=True)
+    try:
+        export_state = state_store.get_export(name)
+    finally:
+        state_store.close()
+    return export_state[2] if export_state else None
+
+
+def _get_key(name, row):
+    # digests keep the memory needed for deduplicating posts independent of their content
+    columns = row if KEY_COLUMNS[name] is None else row[:KEY_COLUMNS[name]]
+    return hashlib.md5("\x1f".join(columns).encode('utf8')).digest()
@@ -0,0 +1,91 @@
+""" Registry of all XPath selectors, compiled once at import time. """
+
+from lxml import etree
+
+
+def _with_class(element, class_name):
+    # see https://stackoverflow.com/a/9133579
+    return element + '[contains(concat(" ", normalize-space(@class), " "), " ' + class_name + ' ")]'
+
+
+def _content(element, class_name=None, target="text", prefix=""):
+    # select text, parent text, or an attribute of the matching elements (relative to the context node)
+    element_selector = _with_class(element, class_name) if class_name else element
+    if target == "text":
+        return "." + prefix + "//" + element_selector + "/text()"
+    elif target == "parent-text":
+        return "." + prefix + "//" + element_selector + "/../text()"
+    elif target.startswith("@"):
+        return "." + prefix + "//" + element_selector + "/" + target
+    raise ValueError("Invalid target: " + target)
+
+
+_HEADER = "//" + _with_class("div", "gh-header-meta")
+_SIDEBAR = "//" + _with_class("div", "discussion-sidebar-item")
+_REACTIONS = "./*/*/*/*/" + _with_class("form", "js-pick-reaction")
+
+SELECTORS = {
+    # repo page
+    "repo.features": '//ul[contains(@class, "UnderlineNav-body")]/li',
+    "repo.feature_labels": 'a/span/text()',
+
+    # discussion listing
+    "listing.discussion_links": '//a[contains(@data-hovercard-type, "discussion")]/@href',
+    "listing.blank_slate": '//div[contains(@class, "blankslate")]/h3/text()',
+    "listing.total_pages": '//' + _with_class("em", "current") + '/@data-total-pages',
+    # rows of the listing and their change markers (relative to a row)
+    "listing.items": '//' + _with_class("div", "Box-row") + '[.//a[contains(@data-hovercard-type, "discussion")]]',
+    "listing.item_link": './/a[contains(@data-hovercard-type, "discussion")]/@href',
+    "listing.item_comment_count": _content("svg", "octicon-comment", "parent-text"),
+    "listing.item_activity": _content("relative-time", None, "@datetime"),
+
+    # discussion metadata
+    "discussion.title": _content("span", "js-issue-title"),
+    "discussion.number": _content("span", "gh-header-number"),
+    "discussion.state": _content("span", "State", "text", _HEADER),
+    "discussion.author": _content("a", "author", "@href", _HEADER),
+    "discussion.emoji": _content("g-emoji", "f5", "text", _HEADER),
+    "discussion.category": _content("g-emoji", "f5", "parent-text", _HEADER),
+    "discussion.timestamp": _content("time-ago", None, "@datetime", _HEADER),
+    "discussion.conversion_remark": _content("svg", "octicon-issue-opened", "parent-text", _SIDEBAR),
+
+    # discussion posts (relative to the div of a post)
+    "discussion.posts": './/' + _with_class("div", "discussion") + '//' + _with_class("div", "timeline-comment"),
+    "thread.posts": 'descendant-or-self::' + _with_class("div", "timeline-comment"),
+    "post.author": _content("a", "author", "@href"),
+    "post.timestamp": _content("time-ago", None, "@datetime"),
+    "post.answer_check": './/' + _with_class("svg", "octicon-check"),
+    # together with post.answer_check, this is equivalent to './/ancestor::...', which visited the ancestors of
+    # every descendant of the post
+    "post.answer_thread_check": 'ancestor-or-self::' + _with_class("div", "discussion-comment") + '//'
+                                + _with_class("svg", "octicon-check"),
+    "post.content": './*/*/*/*/*/*/' + _with_class("td", "comment-body") + '/node()',
+    "post.reaction_emojis": _REACTIONS + '//g-emoji/text()',
+    "post.reaction_counts": _REACTIONS + '//span/text()',
+}
+
+XPATHS = {name: etree.XPath(expression) for name, expression in SELECTORS.items()}
+
+
+def select(name, root):
+    """
+    Apply a registered selector.
+    :param name: Name of the selector.
+    :param root: Context node.
+    :return: List of selected nodes or strings.
+    """
+    return XPATHS[name](root)
+
+
+def select_first(name, root):
+    """
+    Apply a registered selector and return the first non-blank string.
+    :param name: Name of the selector.
+    :param root: Context node.
+    :return: First stripped string or None if there is none.
+    """
+    for value in XPATHS[name](root):
+        value = value.strip()
+        if len(value) > 0:
+            return str(value)
+    return None
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from util.blob_store import BlobReader, BlobStore
+
+
+class BlobStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.directory.name, "contents")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_identical_values_are_stored_once(self):
+        store = BlobStore(self.store_path)
+        first_hash = store.put("<p>Thanks!</p>")
+        self.assertEqual(first_hash, store.put("<p>Thanks!</p>"))
+        second_hash = store.put("<p>\U0001F44D</p>")
+        store.close()
+
+        self.assertEqual(2, store.count)
+        with BlobReader(self.store_path) as reader:
+            self.assertEqual(2, len(reader))
+            self.assertEqual("<p>Thanks!</p>", reader.get(first_hash))
+            self.assertEqual("<p>\U0001F44D</p>", reader.get(second_hash))
+            self.assertIsNone(reader.get("00" * 32))
+
+    def test_compression_level(self):
+        # zstd levels are limited to the highest level of zlib
+        store = BlobStore(self.store_path, compression_level=19)
+        content_hash = store.put("<p>Thanks!</p>" * 100)
+        store.close()
+        self.assertEqual(9, store.compression_level)
+        with BlobReader(self.store_path) as reader:
+            self.assertEqual("<p>Thanks!</p>" * 100, reader.get(content_hash))
+
+    def test_resume(self):
+        # small segments, so that each value is written to its own segment file
+        store = BlobStore(self.store_path, segment_size=1)
+        values = ["<p>Post " + str(index) + "</p>" for index in range(4)]
+        hashes = [store.put(value) for value in values[:2]]
+        offset = store.checkpoint()
+        store.put(values[2])
+        store.close()
+
+        # values written after the last checkpoint are discarded when resuming
+        store = BlobStore(self.store_path, offset, 2, segment_size=1)
+        hashes.append(store.put(values[3]))
+        store.close()
+        self.assertEqual(3, store.count)
+        self.assertEqual(3, len(os.listdir(self.store_path)) - 1)
+        with BlobReader(self.store_path) as reader:
+            self.assertEqual(3, len(reader))
+            self.assertEqual([values[0], values[1], values[3]], [reader.get(content_hash) for content_hash in hashes])
+
+
+if __name__ == '__main__':
+    unittest.main()
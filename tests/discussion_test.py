@@ -1,26 +1,66 @@
 import unittest
 
-import requests
-
+from benchmarks.fixtures import discussion_page
 from github.discussion import Discussion
+from github.parse_pool import ParsePool
+from util.http_cache import CachedResponse
+from util.requests import HttpClient
+from util.retry import RetryPolicy
 
 
 class DiscussionTest(unittest.TestCase):
 
     def setUp(self):
-        self.session = requests.Session()
+        self.client = HttpClient()
 
     def tearDown(self):
-        self.session.close()
+        self.client.close()
 
     def test_nested_posts(self):
         discussion = Discussion("facebook/create-react-app", "/facebook/create-react-app/discussions/9131")
-        discussion.retrieve_discussion_posts(self.session)
+        discussion.retrieve_discussion_posts(self.client)
         self.assertEqual("<p>Just went through the issues on the v4 project and two of them are locked, one has a PR "
                          "that I think is ready, and the other seems like it would be pretty quick (unless I "
                          "misunderstand it).</p>\n<p>Trying to find where I can pitch in :)</p>",
                          discussion.posts[1].content)
 
 
+class FixtureClient(object):
+    """ Serves the same generated discussion thread for every URI. """
+
+    def __init__(self, content):
+        self.content = content
+        self.retry_policy = RetryPolicy(1)
+
+    def get(self, uri, stream=False):
+        return CachedResponse(uri, 200, {}, self.content)
+
+
+class StreamingDiscussionTest(unittest.TestCase):
+
+    def test_streaming_matches_tree_parsing(self):
+        client = FixtureClient(discussion_page("o/r", 42, posts=30, replies=3))
+        discussion = Discussion("o/r", "/o/r/discussions/42")
+        discussion.retrieve_discussion_posts(client)
+        streamed_discussion = Discussion("o/r", "/o/r/discussions/42")
+        streamed_discussion.retrieve_discussion_posts(client, streaming=True)
+
+        self.assertEqual(120, len(streamed_discussion.posts))
+        self.assertEqual(discussion.get_column_values(), streamed_discussion.get_column_values())
+        self.assertEqual(list(discussion.iter_post_rows()), list(streamed_discussion.iter_post_rows()))
+        self.assertEqual(4, sum(post.is_part_of_selected_answer for post in streamed_discussion.posts))
+
+    def test_parse_pool_matches_parsing_in_thread(self):
+        client = FixtureClient(discussion_page("o/r", 42, posts=10, replies=2))
+        discussion = Discussion("o/r", "/o/r/discussions/42")
+        discussion.retrieve_discussion_posts(client)
+        with ParsePool(2) as parse_pool:
+            for streaming in (False, True):
+                pooled_discussion = Discussion("o/r", "/o/r/discussions/42")
+                pooled_discussion.retrieve_discussion_posts(client, streaming, parse_pool)
+                self.assertEqual(discussion.get_column_values(), pooled_discussion.get_column_values())
+                self.assertEqual(list(discussion.iter_post_rows()), list(pooled_discussion.iter_post_rows()))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,114 @@
+import tempfile
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from util.http_cache import ResponseCache
+from util.rate_limiter import RateLimiter
+from util.requests import HttpClient
+from util.retry import RetryPolicy
+
+
+class EtagHandler(BaseHTTPRequestHandler):
+    """ Serves a page with an ETag and counts full and conditional requests. """
+
+    requests = []
+
+    def do_GET(self):
+        conditional = self.headers.get("If-None-Match") == '"v1"'
+        EtagHandler.requests.append(conditional)
+        if conditional:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = b"<html><body>" + self.path.encode('utf8') + b"</body></html>"
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        EtagHandler.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), EtagHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.uri = "http://127.0.0.1:" + str(self.server.server_port)
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.cache_dir.cleanup()
+
+    def get_client(self, ttl, max_size=1024 * 1024, offline=False):
+        cache = ResponseCache(self.cache_dir.name, ttl, max_size, offline)
+        return HttpClient(rate_limiter=RateLimiter(1000, 1000), cache=cache,
+                          retry_policy=RetryPolicy(3, initial_delay=0.001, max_delay=0.001))
+
+    def test_fresh_response(self):
+        with self.get_client(ttl=60) as client:
+            first = client.get(self.uri + "/a")
+            second = client.get(self.uri + "/a")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual([False], EtagHandler.requests)
+
+    def test_conditional_request(self):
+        with self.get_client(ttl=0) as client:
+            client.get(self.uri + "/a")
+            response = client.get(self.uri + "/a")
+        self.assertTrue(response.ok)
+        self.assertEqual(b"<html><body>/a</body></html>", response.content)
+        self.assertEqual([False, True], EtagHandler.requests)
+
+    def test_offline(self):
+        with self.get_client(ttl=60) as client:
+            client.get(self.uri + "/a")
+        with self.get_client(ttl=0, offline=True) as client:
+            self.assertTrue(client.get(self.uri + "/a").ok)
+            self.assertEqual(504, client.get(self.uri + "/b").status_code)
+        self.assertEqual(1, len(EtagHandler.requests))
+
+    def test_rejected_response_is_not_cached(self):
+        with self.get_client(ttl=60) as client:
+            processed = []
+            uri = self.uri + "/a"
+            # the first response is rejected as incomplete, the retry has to request the page again
+            response, failure = client.retry_policy.execute(uri, lambda: client.get(uri),
+                                                            lambda response: processed.append(response) or
+                                                            len(processed) > 1)
+            self.assertIsNone(failure)
+            self.assertIsNotNone(client.cache.lookup(uri))
+        self.assertEqual([False, False], EtagHandler.requests)
+
+    def test_eviction(self):
+        with self.get_client(ttl=60, max_size=60) as client:
+            client.get(self.uri + "/a")
+            client.get(self.uri + "/b")
+            client.get(self.uri + "/c")
+            self.assertIsNone(client.cache.lookup(self.uri + "/a"))
+            self.assertIsNotNone(client.cache.lookup(self.uri + "/c"))
+            self.assertLessEqual(client.cache.size, 60)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        with self.get_client(ttl=60, max_size=100) as client:
+            for path in ("/a", "/b", "/c"):
+                client.get(self.uri + path)
+            client.get(self.uri + "/a")
+            # the cache directory is only scanned at startup
+            with mock.patch("os.walk", side_effect=AssertionError("cache directory scanned")):
+                client.get(self.uri + "/d")
+            self.assertIsNone(client.cache.lookup(self.uri + "/b"))
+            self.assertIsNotNone(client.cache.lookup(self.uri + "/a"))
+            self.assertLessEqual(client.cache.size, 90)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import json
+import logging
+import unittest
+
+from util.log import RateLimitFilter, JsonFormatter
+
+
+def _record(level, msg, *args):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+class LogTest(unittest.TestCase):
+
+    def test_rate_limit(self):
+        rate_limit_filter = RateLimitFilter(burst=2, interval=3600)
+        passed = [rate_limit_filter.filter(_record(logging.ERROR, "Error in: %s", index)) for index in range(5)]
+        self.assertEqual([True, True, False, False, False], passed)
+        # other messages and info messages are not limited
+        self.assertTrue(rate_limit_filter.filter(_record(logging.ERROR, "Other error in: %s", 1)))
+        self.assertTrue(all(rate_limit_filter.filter(_record(logging.INFO, "Info: %s", index)) for index in range(5)))
+
+        # the number of suppressed messages is reported with the first message of the next interval
+        rate_limit_filter.interval = 0
+        record = _record(logging.ERROR, "Error in: %s", 5)
+        self.assertTrue(rate_limit_filter.filter(record))
+        self.assertEqual("Error in: 5 (3 similar messages suppressed)", record.getMessage())
+
+    def test_json_formatter(self):
+        entry = json.loads(JsonFormatter().format(_record(logging.WARNING, "Retrying %s in %s seconds", "uri", 1.5)))
+        self.assertEqual("WARNING", entry["level"])
+        self.assertEqual("Retrying uri in 1.5 seconds", entry["message"])
+
+
+if __name__ == '__main__':
+    unittest.main()
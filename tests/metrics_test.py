@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import unittest
+
+from util.exceptions import IllegalArgumentError
+from util.metrics import Metrics, MetricsReporter
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_counters_and_histograms(self):
+        metrics = Metrics()
+        metrics.increment("requests")
+        metrics.increment("bytes_downloaded", 1024)
+        metrics.observe("fetch", 0.003)
+        metrics.observe("fetch", 0.2)
+        self.assertEqual(1, metrics.get_counter("requests"))
+        self.assertEqual(1024, metrics.get_counter("bytes_downloaded"))
+        histogram = metrics.get_histogram("fetch")
+        self.assertEqual(2, histogram["count"])
+        self.assertAlmostEqual(0.203, histogram["sum"])
+        self.assertEqual(1, histogram["buckets"]["0.005"])
+        self.assertEqual(1, histogram["buckets"]["0.25"])
+        self.assertIn("fetch: ", metrics.summary())
+
+    def test_dump(self):
+        metrics = Metrics()
+        metrics.increment("requests", 3)
+        with metrics.timer("parse"):
+            pass
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, "metrics.json")
+            metrics.dump(json_path)
+            with open(json_path, encoding='utf8') as fp:
+                content = json.load(fp)
+            self.assertEqual(3, content["counters"]["requests"])
+            self.assertEqual(1, content["histograms"]["parse"]["count"])
+            prometheus_path = os.path.join(directory, "metrics.prom")
+            metrics.dump(prometheus_path)
+            with open(prometheus_path, encoding='utf8') as fp:
+                content = fp.read()
+            self.assertIn("github_retriever_requests_total 3", content)
+            self.assertIn('github_retriever_parse_seconds_bucket{le="+Inf"} 1', content)
+
+    def test_reporter_without_interval(self):
+        metrics = Metrics()
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, "metrics.json")
+            # an interval of 0 disables the periodic reports instead of reporting in a busy loop
+            reporter = MetricsReporter(metrics, 0, json_path).start()
+            self.assertFalse(reporter.thread.is_alive())
+            metrics.increment("requests")
+            reporter.stop()
+            with open(json_path, encoding='utf8') as fp:
+                self.assertEqual(1, json.load(fp)["counters"]["requests"])
+        with self.assertRaises(IllegalArgumentError):
+            MetricsReporter(metrics, -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
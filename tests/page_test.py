@@ -0,0 +1,72 @@
+import unittest
+
+from benchmarks.fixtures import listing_page, repo_page
+from github.page import Page, parse_features_streaming
+from github.repo import Repo
+
+REPO_PAGE = b"""<html><body><nav><ul class="UnderlineNav-body list-style-none">
+<li><a href="/o/r"><span>Code</span></a></li>
+<li><a href="/o/r/issues"><span>Issues</span><span class="Counter">12</span></a></li>
+<li><a href="/o/r/discussions"><span>Discussions</span></a></li>
+</ul></nav></body></html>"""
+
+LISTING_PAGE = b"""<html><body>
+<a data-hovercard-type="discussion" href="/o/r/discussions/2">Second</a>
+<a data-hovercard-type="discussion" href="/o/r/discussions/1">First</a>
+</body></html>"""
+
+BLANK_SLATE_PAGE = b"""<html><body><div class="blankslate">
+<h3>
+  There aren't any discussions.
+</h3></div></body></html>"""
+
+
+class PageTest(unittest.TestCase):
+
+    def test_features(self):
+        page = Page("https://github.com/o/r", REPO_PAGE)
+        self.assertEqual([["Code"], ["Issues", "12"], ["Discussions"]], page.get_features())
+
+    def test_features_streaming(self):
+        content = repo_page("o/r", readme_paragraphs=1000)
+        chunks = [content[start:start + 1024] for start in range(0, len(content), 1024)]
+        features, bytes_read = parse_features_streaming(iter(chunks))
+        self.assertEqual(Page("https://github.com/o/r", content).get_features(), features)
+        self.assertLess(bytes_read, 4096)
+        self.assertEqual(([], len(LISTING_PAGE)), parse_features_streaming([LISTING_PAGE]))
+
+    def test_repo_features(self):
+        repo = Repo("o/r", None)
+        for feature in Page("https://github.com/o/r", REPO_PAGE).get_features():
+            repo.process_feature(feature)
+        self.assertEqual(["o/r", True, True, False, True, False, False, False, False, False],
+                         repo.get_column_values())
+        self.assertTrue(repo.has_issues)
+        repo.has_issues = False
+        self.assertFalse(repo.has_issues)
+        self.assertFalse(repo.all_features_false())
+
+    def test_discussion_markers(self):
+        page = Page("https://github.com/o/r/discussions", listing_page("o/r", [9, 8]))
+        self.assertEqual({"/o/r/discussions/9": "2|", "/o/r/discussions/8": "1|"}, page.get_discussion_markers())
+        self.assertEqual({}, Page("https://github.com/o/r/discussions", LISTING_PAGE).get_discussion_markers())
+
+    def test_total_pages(self):
+        self.assertEqual(3, Page("https://github.com/o/r/discussions", listing_page("o/r", [9], 2, 3)).get_total_pages())
+        self.assertIsNone(Page("https://github.com/o/r/discussions", LISTING_PAGE).get_total_pages())
+
+    def test_parsed_once(self):
+        page = Page("https://github.com/o/r/discussions?page=1", LISTING_PAGE)
+        tree = page.tree
+        self.assertEqual(["/o/r/discussions/2", "/o/r/discussions/1"], page.get_discussion_links())
+        self.assertFalse(Repo.reached_last_page(page))
+        self.assertIs(tree, page.tree)
+
+    def test_blank_slate(self):
+        page = Page("https://github.com/o/r/discussions?page=2", BLANK_SLATE_PAGE)
+        self.assertTrue(Repo.reached_last_page(page))
+        self.assertEqual([], page.get_discussion_links())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+
+from util.exceptions import IllegalArgumentError
+from util.rate_limiter import RateLimiter, parse_retry_after
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_burst(self):
+        rate_limiter = RateLimiter(requests_per_second=1, burst=3)
+        delays = [rate_limiter.reserve() for _ in range(4)]
+        self.assertEqual([0.0, 0.0, 0.0], delays[:3])
+        self.assertAlmostEqual(1.0, delays[3], places=1)
+
+    def test_retry_after(self):
+        rate_limiter = RateLimiter(requests_per_second=100, burst=10)
+        self.assertTrue(rate_limiter.report(429, "3"))
+        self.assertAlmostEqual(3.0, rate_limiter.reserve(), places=1)
+
+    def test_requests_are_spread_after_block(self):
+        rate_limiter = RateLimiter(requests_per_second=10, burst=10)
+        self.assertTrue(rate_limiter.report(429, "2"))
+        # requests queued during the block do not all fire at its end
+        delays = [rate_limiter.reserve() for _ in range(3)]
+        for index, delay in enumerate(delays):
+            self.assertAlmostEqual(2.0 + (index + 1) * 0.1, delay, places=1)
+
+    def test_waiting_requests_respect_later_block(self):
+        rate_limiter = RateLimiter(requests_per_second=2, burst=1)
+        rate_limiter.acquire()
+        sent = []
+        start = time.monotonic()
+        threads = [threading.Thread(target=lambda: rate_limiter.acquire() or sent.append(time.monotonic() - start))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        # the threads are waiting for their tokens (0.5, 1.0, and 1.5 seconds) when the server blocks requests
+        time.sleep(0.1)
+        rate_limiter.report(429, "2")
+        for thread in threads:
+            thread.join()
+        self.assertEqual(3, len(sent))
+        self.assertGreaterEqual(min(sent), 2.0)
+        # and are sent one token interval apart after the block
+        self.assertLess(max(sent), 4.0)
+
+    def test_exponential_backoff(self):
+        rate_limiter = RateLimiter(requests_per_second=100, burst=10, initial_backoff=1, max_backoff=4)
+        for expected_backoff in [1, 2, 4, 4]:
+            rate_limiter.report(503)
+            self.assertEqual(expected_backoff, rate_limiter.backoff)
+        self.assertFalse(rate_limiter.report(200))
+        self.assertEqual(2, rate_limiter.backoff)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(120.0, parse_retry_after("120"))
+        self.assertEqual(0.0, parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_illegal_arguments(self):
+        self.assertRaises(IllegalArgumentError, RateLimiter, 0, 1)
+        self.assertRaises(IllegalArgumentError, RateLimiter, 1, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
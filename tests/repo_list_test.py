@@ -0,0 +1,279 @@
+import asyncio
+import csv
+import gzip
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from unittest import mock
+
+import github
+from benchmarks.server import StandInConfig, StandInServer, discussion_count
+from github.discussion import Discussion
+from github.repo import Repo
+from github.repo_list import RepoList
+from github.shards import merge_shards
+from util.blob_store import BlobReader
+from util.compression import open_text_input
+from util.rate_limiter import RateLimiter
+from util.requests import HttpClient, AsyncHttpClient, httpx
+
+REPO_NAMES = ["owner/repo" + str(index) for index in range(6)]
+
+
+class RepoListTest(unittest.TestCase):
+    """ Retrieves repos from a local stand-in server for github.com. """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(StandInConfig(max_discussions=30, posts=2, replies=1,
+                                                 redirects={"old/repo1": "owner/repo1"})).start()
+        cls.github_url = github.GITHUB_URL
+        github.GITHUB_URL = cls.server.url
+
+    @classmethod
+    def tearDownClass(cls):
+        github.GITHUB_URL = cls.github_url
+        cls.server.stop()
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.input_file = os.path.join(self.work_dir.name, "repos.csv")
+        with open(self.input_file, 'w', encoding='utf8') as fp:
+            fp.write("repo_name\n" + "\n".join(REPO_NAMES) + "\n")
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def retrieve(self, output_dir, workers=1, pipeline=False, use_asyncio=False, shard_index=0, shard_count=1,
+                 resume=False, previous_run=None, stream_features=False, listing_prefetch=0, compression=None,
+                 blob_store=False):
+        output_dir = os.path.join(self.work_dir.name, output_dir)
+        with HttpClient(workers, rate_limiter=RateLimiter(1000, 100)) as client:
+            async_client = AsyncHttpClient(client, 4) if use_asyncio else None
+            repo_list = RepoList(self.input_file, output_dir, ",", client, resume, async_client=async_client,
+                                 shard_index=shard_index, shard_count=shard_count, previous_run=previous_run,
+                                 stream_features=stream_features, listing_prefetch=listing_prefetch,
+                                 compression=compression, blob_store=blob_store)
+            if not pipeline:
+                repo_list.read_from_csv()
+            repo_list.retrieve_data(2, True, True, True, workers, False, pipeline)
+            repo_list.close()
+            if async_client:
+                async_client.close()
+        if shard_count > 1:
+            return None
+        return self.read_outputs(output_dir, compression)
+
+    @staticmethod
+    def read_outputs(output_dir, compression=None):
+        outputs = {}
+        for filename in ("repos.csv", "repos_discussions.csv", "repos_discussion_posts.csv"):
+            file_path = os.path.join(output_dir, filename + ("." + compression if compression else ""))
+            with open_text_input(file_path) as fp:
+                outputs[filename] = list(csv.reader(fp))
+        return outputs
+
+    def test_retrieve_data(self):
+        outputs = self.retrieve("sequential")
+
+        self.assertEqual(["repo_name", "True", "True", "True", "True", "True", "True", "True", "True", "True"],
+                         ["repo_name"] + outputs["repos.csv"][1][1:])
+        self.assertEqual(REPO_NAMES, [row[0] for row in outputs["repos.csv"][1:]])
+
+        discussion_counts = [discussion_count(repo_name, 30) for repo_name in REPO_NAMES]
+        discussion_rows = outputs["repos_discussions.csv"][1:]
+        self.assertEqual(sum(max(1, count) for count in discussion_counts), len(discussion_rows))
+        self.assertEqual(sum(discussion_counts) * 4, len(outputs["repos_discussion_posts.csv"]) - 1)
+
+    def test_no_request_after_last_page(self):
+        # repos with two listing pages
+        repo_names = REPO_NAMES + ["owner/repo9", "owner/repo77"]
+        with open(self.input_file, 'a', encoding='utf8') as fp:
+            fp.write("\n".join(repo_names[len(REPO_NAMES):]) + "\n")
+        requests = self.server.get_stats()["requests"]
+        outputs = self.retrieve("prefetch", listing_prefetch=2)
+        discussion_counts = [discussion_count(repo_name, 30) for repo_name in repo_names]
+        self.assertEqual(sum(discussion_counts), len(set(row[1] for row in outputs["repos_discussions.csv"][1:]
+                                                         if row[1] != "n/a")))
+        # repo page, listing pages (one blank slate for repos without discussions), and discussion threads
+        expected = sum(1 + max(1, (count + 24) // 25) + count for count in discussion_counts)
+        self.assertEqual(expected, self.server.get_stats()["requests"] - requests)
+
+    def test_no_prefetch_in_unchanged_incremental_run(self):
+        # repos with two listing pages
+        repo_names = REPO_NAMES + ["owner/repo9", "owner/repo77"]
+        with open(self.input_file, 'a', encoding='utf8') as fp:
+            fp.write("\n".join(repo_names[len(REPO_NAMES):]) + "\n")
+        self.retrieve("previous", listing_prefetch=2)
+        previous_run = os.path.join(self.work_dir.name, "previous", "repos_progress.sqlite")
+        for use_asyncio in ([False, True] if httpx else [False]):
+            # only the repo page and the first listing page, which is unchanged, are retrieved
+            requests = self.server.get_stats()["requests"]
+            self.retrieve("unchanged", use_asyncio=use_asyncio, previous_run=previous_run, listing_prefetch=2)
+            self.assertEqual(2 * len(repo_names), self.server.get_stats()["requests"] - requests)
+
+    def test_duplicates_and_redirects(self):
+        with open(self.input_file, 'a', encoding='utf8') as fp:
+            fp.write("OWNER/REPO0\nowner/repo0\nold/repo1\n")
+        outputs = self.retrieve("duplicates")
+        self.assertEqual(REPO_NAMES[:1] + ["OWNER/REPO0"] + REPO_NAMES[1:] + ["old/repo1"],
+                         [row[0] for row in outputs["repos.csv"][1:]])
+        self.assertEqual(outputs["repos.csv"][1][1:], outputs["repos.csv"][2][1:])
+        previous_run = os.path.join(self.work_dir.name, "duplicates", "repos_progress.sqlite")
+        connection = sqlite3.connect(previous_run)
+        self.assertEqual([("old/repo1", "owner/repo1")], connection.execute("SELECT * FROM aliases").fetchall())
+        connection.close()
+
+        # the renamed repo is retrieved once by its new name, unchanged discussions are not retrieved again
+        requests = self.server.get_stats()["requests"]
+        outputs = self.retrieve("aliases", previous_run=previous_run)
+        self.assertEqual(2 * len(REPO_NAMES), self.server.get_stats()["requests"] - requests)
+        self.assertEqual(REPO_NAMES[:1] + ["OWNER/REPO0"] + REPO_NAMES[1:2] + ["old/repo1"] + REPO_NAMES[2:],
+                         [row[0] for row in outputs["repos.csv"][1:]])
+
+    def test_resume_with_redirect(self):
+        with open(self.input_file, 'w', encoding='utf8') as fp:
+            fp.write("repo_name\nold/repo1\nowner/repo2\n")
+        self.retrieve("redirect")
+        # the renamed repo has been completed and is not retrieved again
+        requests = self.server.get_stats()["requests"]
+        outputs = self.retrieve("redirect", resume=True)
+        self.assertEqual(0, self.server.get_stats()["requests"] - requests)
+        self.assertEqual(["old/repo1", "owner/repo2"], [row[0] for row in outputs["repos.csv"][1:]])
+
+    def test_resume_with_other_output_dir_path(self):
+        outputs = self.retrieve("complete")
+        with open(self.input_file, 'w', encoding='utf8') as fp:
+            fp.write("repo_name\n" + "\n".join(REPO_NAMES[:2]) + "\n")
+        self.retrieve("resume")
+        with open(self.input_file, 'w', encoding='utf8') as fp:
+            fp.write("repo_name\n" + "\n".join(REPO_NAMES) + "\n")
+        # the export files are continued, although the output directory is spelled differently
+        self.assertEqual(outputs, self.retrieve(os.path.join(".", "resume"), resume=True))
+
+    def test_shards_with_redirect(self):
+        with open(self.input_file, 'w', encoding='utf8') as fp:
+            fp.write("repo_name\nold/repo1\n")
+        for shard_index in range(2):
+            self.retrieve("shards", shard_index=shard_index, shard_count=2)
+        # the renamed repo stays in the shard of its input name (1), although its new name belongs to shard 0
+        for shard_index in range(2):
+            previous_run = os.path.join(self.work_dir.name, "shards",
+                                        "repos_shard-" + str(shard_index) + "-of-2_progress.sqlite")
+            self.retrieve("incremental", shard_index=shard_index, shard_count=2, previous_run=previous_run)
+        repo_names = []
+        for shard_index in range(2):
+            file_path = os.path.join(self.work_dir.name, "incremental", "repos_shard-" + str(shard_index) + "-of-2.csv")
+            if os.path.exists(file_path):
+                with open(file_path, encoding='utf8', newline='') as fp:
+                    repo_names.append([row[0] for row in csv.reader(fp)][1:])
+            else:
+                repo_names.append([])
+        self.assertEqual([[], ["old/repo1"]], repo_names)
+
+    def test_requests_after_redirect(self):
+        with open(self.input_file, 'w', encoding='utf8') as fp:
+            fp.write("repo_name\nold/repo1\n")
+        requests = self.server.get_stats()["requests"]
+        self.retrieve("redirect")
+        # only the repo page is redirected, the listing pages are requested with the new name
+        count = discussion_count("owner/repo1", 30)
+        self.assertEqual(1 + 1 + max(1, (count + 24) // 25) + count, self.server.get_stats()["requests"] - requests)
+
+    def test_failures(self):
+        with open(self.input_file, 'a', encoding='utf8') as fp:
+            fp.write("missing\n")
+        outputs = self.retrieve("failures")
+
+        self.assertEqual(REPO_NAMES, [row[0] for row in outputs["repos.csv"][1:]])
+        with open(os.path.join(self.work_dir.name, "failures", "repos_failures.csv"), encoding='utf8') as fp:
+            failures = list(csv.reader(fp))
+        self.assertEqual([["missing", self.server.url + "/missing", "404", "permanent", "1"]], failures[1:])
+
+    def test_concurrent_and_pipelined_output_is_identical(self):
+        outputs = self.retrieve("sequential")
+        self.assertEqual(outputs, self.retrieve("concurrent", workers=3))
+        self.assertEqual(outputs, self.retrieve("pipeline", workers=3, pipeline=True))
+        self.assertEqual(outputs, self.retrieve("stream-features", workers=3, stream_features=True))
+        self.assertEqual(outputs, self.retrieve("prefetch", workers=3, listing_prefetch=2))
+
+    @unittest.skipIf(httpx is None, "requires the optional package httpx")
+    def test_asyncio_output_is_identical(self):
+        outputs = self.retrieve("sequential")
+        self.assertEqual(outputs, self.retrieve("asyncio", use_asyncio=True))
+        self.assertEqual(outputs, self.retrieve("asyncio-pipeline", workers=2, pipeline=True, use_asyncio=True))
+        self.assertEqual(outputs, self.retrieve("asyncio-prefetch", use_asyncio=True, listing_prefetch=2))
+
+    @unittest.skipIf(httpx is None, "requires the optional package httpx")
+    def test_asyncio_fetcher_failure(self):
+        # more discussions than fit into the queue of a single fetcher
+        repo_name = next(repo_name for repo_name in ("owner/repo" + str(index) for index in range(100))
+                         if discussion_count(repo_name, 30) >= 10)
+        with HttpClient(rate_limiter=RateLimiter(1000, 100)) as client, AsyncHttpClient(client, 1) as async_client:
+            repo = Repo(repo_name, client)
+            with mock.patch.object(Discussion, "retrieve_discussion_posts_async", side_effect=RuntimeError("failed")):
+                # the failure of the fetcher is raised instead of waiting for the queue forever
+                with self.assertRaises(RuntimeError):
+                    async_client.run(asyncio.wait_for(repo.retrieve_discussions_async(True, async_client), 10))
+
+    def test_shards(self):
+        outputs = self.retrieve("sequential")
+        for shard_index in range(3):
+            self.retrieve("shards", shard_index=shard_index, shard_count=3)
+        # a shard that has been run twice must not lead to duplicates
+        self.retrieve("shards", shard_index=1, shard_count=3)
+        merge_shards(self.input_file, os.path.join(self.work_dir.name, "shards"), ",", 3)
+        merged_outputs = self.read_outputs(os.path.join(self.work_dir.name, "shards"))
+        for filename, rows in outputs.items():
+            self.assertEqual(rows[0], merged_outputs[filename][0])
+            self.assertEqual(sorted(rows[1:]), sorted(merged_outputs[filename][1:]))
+
+    def test_compression(self):
+        outputs = self.retrieve("sequential")
+        with open(self.input_file, 'rb') as fp:
+            content = fp.read()
+        self.input_file = self.input_file + ".gz"
+        with gzip.open(self.input_file, 'wb') as fp:
+            fp.write(content)
+        # a backup frequency of 2 leads to files with several gzip members
+        self.assertEqual(outputs, self.retrieve("compressed", compression="gz"))
+
+    def test_blob_store(self):
+        outputs = self.retrieve("sequential")
+        blob_outputs = self.retrieve("blobs", blob_store=True)
+        posts = outputs["repos_discussion_posts.csv"]
+        blob_posts = blob_outputs["repos_discussion_posts.csv"]
+        self.assertEqual(posts[0][:-1] + ["content_hash"], blob_posts[0])
+        with BlobReader(os.path.join(self.work_dir.name, "blobs", "repos_discussion_post_contents")) as reader:
+            self.assertEqual(posts[1:], [row[:-1] + [reader.get(row[-1])] for row in blob_posts[1:]])
+            # the stand-in server uses the same content for several posts
+            self.assertLess(len(reader), len(posts) - 1)
+
+    def test_incremental(self):
+        self.retrieve("previous")
+        previous_run = os.path.join(self.work_dir.name, "previous", "repos_progress.sqlite")
+        repo_names = [repo_name for repo_name in REPO_NAMES if discussion_count(repo_name, 30) > 0][:2]
+        changed = github.GITHUB_URL + "/" + repo_names[0] + "/discussions/" + str(discussion_count(repo_names[0], 30))
+        new = github.GITHUB_URL + "/" + repo_names[1] + "/discussions/" + str(discussion_count(repo_names[1], 30))
+        connection = sqlite3.connect(previous_run)
+        with connection:
+            connection.execute("UPDATE discussions SET marker = 'outdated' WHERE uri = ?", (changed,))
+            connection.execute("DELETE FROM discussions WHERE uri = ?", (new,))
+        connection.close()
+
+        outputs = self.retrieve("incremental", previous_run=previous_run)
+        self.assertEqual(REPO_NAMES, [row[0] for row in outputs["repos.csv"][1:]])
+        self.assertEqual([changed, new], [row[1] for row in outputs["repos_discussions.csv"][1:]
+                                          if row[1] != "n/a"])
+        self.assertEqual(8, len(outputs["repos_discussion_posts.csv"]) - 1)
+
+        # unchanged discussions are carried over to the next run
+        outputs = self.retrieve("unchanged", previous_run=os.path.join(self.work_dir.name, "incremental",
+                                                                       "repos_progress.sqlite"))
+        self.assertEqual([], [row for row in outputs["repos_discussions.csv"][1:] if row[1] != "n/a"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from util.exceptions import IllegalArgumentError
+from util.http_cache import CachedResponse
+from util.retry import RetryPolicy, classify, SUCCESS, TRANSIENT, PERMANENT
+
+
+class ResponseSequence(object):
+    """ Returns the given status codes one after another, None stands for a connection error. """
+
+    def __init__(self, status_codes):
+        self.status_codes = list(status_codes)
+        self.requests = 0
+
+    def __call__(self):
+        status_code = self.status_codes[self.requests]
+        self.requests = self.requests + 1
+        if status_code is None:
+            raise ConnectionError("connection closed")
+        return CachedResponse("https://github.com/o/r", status_code, {}, b"")
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.retry_policy = RetryPolicy(max_attempts=3, initial_delay=0.001, max_delay=0.001)
+
+    def test_classify(self):
+        self.assertEqual(SUCCESS, classify(CachedResponse("uri", 200, {}, b"")))
+        self.assertEqual(TRANSIENT, classify(None))
+        for status_code in [429, 500, 502, 503]:
+            self.assertEqual(TRANSIENT, classify(CachedResponse("uri", status_code, {}, b"")))
+        for status_code in [404, 451, 403]:
+            self.assertEqual(PERMANENT, classify(CachedResponse("uri", status_code, {}, b"")))
+
+    def test_transient_errors_are_retried(self):
+        request = ResponseSequence([503, None, 200])
+        response, failure = self.retry_policy.execute("uri", request)
+        self.assertIsNone(failure)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, request.requests)
+
+    def test_permanent_errors_are_not_retried(self):
+        request = ResponseSequence([404, 200])
+        _, failure = self.retry_policy.execute("uri", request)
+        self.assertTrue(failure.permanent)
+        self.assertEqual(404, failure.status_code)
+        self.assertEqual(1, request.requests)
+
+    def test_maximum_number_of_attempts(self):
+        request = ResponseSequence([500, 500, 500, 200])
+        _, failure = self.retry_policy.execute("uri", request)
+        self.assertFalse(failure.permanent)
+        self.assertEqual(3, failure.attempts)
+        self.assertEqual(3, request.requests)
+
+    def test_incomplete_responses_are_retried(self):
+        request = ResponseSequence([200, 200])
+        processed = []
+        _, failure = self.retry_policy.execute("uri", request, lambda response: processed.append(response) or
+                                               len(processed) > 1)
+        self.assertIsNone(failure)
+        self.assertEqual(2, request.requests)
+
+    def test_delay(self):
+        retry_policy = RetryPolicy(initial_delay=1, max_delay=5)
+        for attempt in range(1, 10):
+            self.assertLessEqual(retry_policy.get_delay(attempt), min(5, 2 ** (attempt - 1)))
+        self.assertRaises(IllegalArgumentError, RetryPolicy, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
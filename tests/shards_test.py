@@ -0,0 +1,45 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from github.shards import get_shard, get_shard_filename, merge_shards
+from util.state_store import StateStore
+
+
+class ShardsTest(unittest.TestCase):
+
+    def test_get_shard(self):
+        repo_names = ["owner/repo" + str(index) for index in range(1000)]
+        shards = [get_shard(repo_name, 4) for repo_name in repo_names]
+        self.assertEqual(set(range(4)), set(shards))
+        self.assertEqual(get_shard("facebook/react", 4), get_shard("Facebook/React", 4))
+        # the assignment must not change between runs and machines
+        self.assertEqual(3, get_shard("facebook/react", 4))
+
+    def test_get_shard_filename(self):
+        self.assertEqual("repos.csv", get_shard_filename("repos.csv", 0, 1))
+        self.assertEqual("repos_shard-2-of-4.csv", get_shard_filename("repos.csv", 2, 4))
+
+    def test_merge_shards(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            self.write_rows(output_dir, "repos_shard-0-of-2.csv", [["a/a", "True"], ["b/b", "True"]])
+            self.write_rows(output_dir, "repos_shard-1-of-2.csv", [["c/c", "False"], ["a/a", "True"], ["d/d", "True"]])
+            # the last row of shard 1 has been written after its last checkpoint
+            state_store = StateStore(os.path.join(output_dir, "repos_shard-1-of-2_progress.sqlite"))
+            state_store.commit([], [], [("repos", "repos_shard-1-of-2.csv", 0, 2)])
+            state_store.close()
+
+            merge_shards("input/repos.csv", output_dir, ",", 2)
+            with open(os.path.join(output_dir, "repos.csv"), encoding='utf8', newline='') as fp:
+                self.assertEqual([["repo_name", "has_code"], ["a/a", "True"], ["b/b", "True"], ["c/c", "False"]],
+                                 list(csv.reader(fp)))
+
+    @staticmethod
+    def write_rows(output_dir, filename, rows):
+        with open(os.path.join(output_dir, filename), 'w', encoding='utf8', newline='') as fp:
+            csv.writer(fp).writerows([["repo_name", "has_code"]] + rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from util.state_store import StateStore, DONE, FAILED
+
+
+class StateStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.output_dir.name, "repos_progress.sqlite")
+
+    def tearDown(self):
+        self.output_dir.cleanup()
+
+    def test_resume(self):
+        state_store = StateStore(self.file_path)
+        state_store.commit([("facebook/react", DONE), ("microsoft/vscode", FAILED)],
+                           [("https://github.com/facebook/react/discussions/1", "facebook/react", DONE, "3|")],
+                           [("repos", "output/repos.csv", 42, 2)])
+        state_store.close()
+
+        state_store = StateStore(self.file_path, resume=True)
+        self.assertEqual({"facebook/react"}, state_store.get_repo_names(DONE))
+        self.assertEqual({"microsoft/vscode"}, state_store.get_repo_names(FAILED))
+        self.assertEqual({"https://github.com/facebook/react/discussions/1"}, state_store.get_discussion_uris(DONE))
+        self.assertEqual(("output/repos.csv", 42, 2), state_store.get_export("repos"))
+        state_store.close()
+
+    def test_new_run(self):
+        state_store = StateStore(self.file_path)
+        state_store.commit([("facebook/react", DONE)], [], [], [("old/name", "o/r")])
+        state_store.close()
+
+        # the progress is discarded, the aliases are kept
+        state_store = StateStore(self.file_path)
+        self.assertEqual(set(), state_store.get_repo_names(DONE))
+        self.assertIsNone(state_store.get_export("repos"))
+        self.assertEqual({"old/name": "o/r"}, state_store.get_aliases())
+        state_store.close()
+
+    def test_import_previous_run(self):
+        state_store = StateStore(self.file_path)
+        state_store.commit([], [("https://github.com/o/r/discussions/1", "o/r", DONE, "3|"),
+                                ("https://github.com/o/r/discussions/2", "o/r", FAILED, "1|")], [],
+                           [("old/name", "o/r")])
+        state_store.close()
+
+        state_store = StateStore(os.path.join(self.output_dir.name, "next", "repos_progress.sqlite"))
+        state_store.commit([], [("https://github.com/o/r/discussions/1", "o/r", DONE, "4|")], [])
+        self.assertEqual(0, state_store.import_previous_run(self.file_path))
+        self.assertEqual({"old/name": "o/r"}, state_store.get_aliases())
+        self.assertEqual({"https://github.com/o/r/discussions/1": "4|"}, state_store.get_discussion_markers("o/r"))
+        state_store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
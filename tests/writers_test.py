@@ -0,0 +1,129 @@
+import csv
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from util.compression import open_text_input, zstandard
+from util.writers import CsvWriter, JsonlWriter, ParquetWriter, pyarrow
+
+POST_COLUMNS = ["discussion", "timestamp", "reactions", "is_part_of_selected_answer", "number"]
+POST_TYPES = ["string", "timestamp", "reactions", "bool", "int"]
+POST_ROWS = [
+    ["o/r/discussions/1", "2020-06-03T18:41:10Z", [["\U0001F44D", "\U0001F440"], [5, 1]], False, 1],
+    ["o/r/discussions/2", None, None, True, "n/a"]
+]
+
+
+class CsvWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.output_dir.name, "repos.csv")
+
+    def tearDown(self):
+        self.output_dir.cleanup()
+
+    def read_rows(self):
+        with open(self.file_path, encoding='utf8', newline='') as fp:
+            return list(csv.reader(fp))
+
+    def test_incremental_writes(self):
+        writer = CsvWriter(self.file_path, ["repo_name", "has_code"], ",")
+        writer.write_row(["facebook/react", True])
+        writer.checkpoint()
+        self.assertEqual([["repo_name", "has_code"], ["facebook/react", "True"]], self.read_rows())
+        writer.write_row(["microsoft/vscode", False])
+        writer.close()
+        self.assertEqual(2, writer.count)
+        self.assertEqual(["microsoft/vscode", "False"], self.read_rows()[2])
+
+
+class CompressedWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.output_dir.cleanup()
+
+    def check_resume(self, compression):
+        file_path = os.path.join(self.output_dir.name, "repos.csv." + compression)
+        writer = CsvWriter(file_path, ["repo_name", "has_code"], ",")
+        writer.write_row(["facebook/react", True])
+        offset = writer.checkpoint()
+        writer.write_row(["torvalds/linux", True])
+        writer.close()
+
+        # the file can be truncated to the offset of a checkpoint and still be read completely
+        writer = CsvWriter(file_path, ["repo_name", "has_code"], ",", offset, 1)
+        writer.write_row(["microsoft/vscode", False])
+        writer.close()
+        with open_text_input(file_path) as fp:
+            rows = list(csv.reader(fp))
+        self.assertEqual([["repo_name", "has_code"], ["facebook/react", "True"], ["microsoft/vscode", "False"]], rows)
+        self.assertEqual(2, writer.count)
+
+    def test_gzip(self):
+        self.check_resume("gz")
+
+    @unittest.skipIf(zstandard is None, "requires the optional package zstandard")
+    def test_zstd(self):
+        self.check_resume("zst")
+
+
+class TypedWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.output_dir.cleanup()
+
+    def test_jsonl(self):
+        file_path = os.path.join(self.output_dir.name, "posts.jsonl")
+        writer = JsonlWriter(file_path, POST_COLUMNS, POST_TYPES)
+        writer.write_row(POST_ROWS[0])
+        offset = writer.checkpoint()
+        writer.write_row(POST_ROWS[1])
+        writer.close()
+
+        # rows written after the last checkpoint are discarded when resuming
+        writer = JsonlWriter(file_path, POST_COLUMNS, POST_TYPES, offset, 1)
+        writer.write_row(POST_ROWS[1])
+        writer.close()
+        with open(file_path, encoding='utf8') as fp:
+            records = [json.loads(line) for line in fp]
+        self.assertEqual([{"discussion": "o/r/discussions/1", "timestamp": "2020-06-03T18:41:10Z",
+                           "reactions": [{"emoji": "\U0001F44D", "count": 5}, {"emoji": "\U0001F440", "count": 1}],
+                           "is_part_of_selected_answer": False, "number": 1},
+                          {"discussion": "o/r/discussions/2", "timestamp": None, "reactions": None,
+                           "is_part_of_selected_answer": True, "number": None}], records)
+        self.assertEqual(2, writer.count)
+
+    @unittest.skipIf(pyarrow is None, "requires the optional package pyarrow")
+    def test_parquet(self):
+        file_path = os.path.join(self.output_dir.name, "posts.parquet")
+        writer = ParquetWriter(file_path, POST_COLUMNS, POST_TYPES, batch_size=1)
+        writer.write_row(POST_ROWS[0])
+        offset = writer.checkpoint()
+        writer.write_row(POST_ROWS[1])
+        # interrupted before the next checkpoint, the incomplete file is discarded when resuming
+        writer = ParquetWriter(file_path, POST_COLUMNS, POST_TYPES, offset, 1)
+        writer.write_row(POST_ROWS[1])
+        writer.close()
+
+        table = pyarrow.parquet.read_table(file_path)
+        self.assertEqual(2, table.num_rows)
+        self.assertEqual(["o/r/discussions/1", "o/r/discussions/2"], table.column("discussion").to_pylist())
+        self.assertEqual(datetime.datetime(2020, 6, 3, 18, 41, 10, tzinfo=datetime.timezone.utc),
+                         table.column("timestamp").to_pylist()[0])
+        self.assertEqual([{"emoji": "\U0001F44D", "count": 5}, {"emoji": "\U0001F440", "count": 1}],
+                         table.column("reactions").to_pylist()[0])
+        self.assertEqual([False, True], table.column("is_part_of_selected_answer").to_pylist())
+        self.assertEqual([1, None], table.column("number").to_pylist())
+
+
+if __name__ == '__main__':
+    unittest.main()
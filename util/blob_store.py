@@ -0,0 +1,160 @@
+""" Content-addressed store for large text values (e.g., the contents of posts). """
+
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+
+# each index record maps the SHA-256 hash of a value to its compressed bytes: hash, segment, offset, length
+INDEX_RECORD = struct.Struct("<32sIQI")
+INDEX_FILENAME = "index.bin"
+
+# a new segment file is started once the current one has reached this size
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+# values are compressed separately, so that each of them can be read on its own
+COMPRESSION_LEVEL = 6
+
+
+def _get_segment_path(directory, segment):
+    return os.path.join(directory, "segment-{0:05d}.bin".format(segment))
+
+
+def _read_index(directory):
+    """
+    :return: Dictionary mapping the binary hash of each value to a tuple (segment, offset, length).
+    """
+    with open(os.path.join(directory, INDEX_FILENAME), 'rb') as fp:
+        data = fp.read()
+    # a record that is being written while the index is read is ignored
+    data = data[:len(data) - len(data) % INDEX_RECORD.size]
+    return {digest: (segment, offset, length) for digest, segment, offset, length in INDEX_RECORD.iter_unpack(data)}
+
+
+class BlobStore(object):
+    """
+    Writes each distinct value once, compressed, to append-only segment files and records its position in an
+    index file. Values are addressed by their SHA-256 hash, so that identical values (e.g., bot comments) are only
+    stored once.
+    Like the export files, the store is flushed to disk at checkpoints and can be resumed from the size of its index
+    at the last checkpoint, values written afterwards are discarded.
+    """
+
+    def __init__(self, directory, resume_offset=None, resume_count=0, compression_level=None,
+                 segment_size=SEGMENT_SIZE):
+        self.file_path = directory
+        # the level of the export files may be a zstd level, which is limited to the highest level of zlib
+        self.compression_level = min(int(compression_level), zlib.Z_BEST_COMPRESSION) \
+            if compression_level is not None else COMPRESSION_LEVEL
+        self.segment_size = segment_size
+        # binary hash -> (segment, offset, length) of all stored values
+        self.index = {}
+        self.count = 0
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        index_path = os.path.join(directory, INDEX_FILENAME)
+        if resume_offset is not None and os.path.exists(index_path):
+            os.truncate(index_path, resume_offset)
+            self.index = _read_index(directory)
+            self.count = resume_count
+        else:
+            open(index_path, 'wb').close()
+
+        # continue after the last value recorded in the index and discard everything written after it
+        self.segment, end = 0, 0
+        for segment, offset, length in self.index.values():
+            if (segment, offset + length) > (self.segment, end):
+                self.segment, end = segment, offset + length
+        for filename in os.listdir(directory):
+            if filename.startswith("segment-") and int(filename[8:13]) > self.segment:
+                os.remove(os.path.join(directory, filename))
+        segment_path = _get_segment_path(directory, self.segment)
+        if os.path.exists(segment_path):
+            os.truncate(segment_path, end)
+        self.segment_fp = open(segment_path, 'ab')
+        self.index_fp = open(index_path, 'ab')
+
+    def put(self, value):
+        """
+        Store a value unless an identical value has been stored before.
+        :return: Hexadecimal SHA-256 hash of the value.
+        """
+        encoded = value.encode('utf8')
+        digest = hashlib.sha256(encoded).digest()
+        if digest not in self.index:
+            data = zlib.compress(encoded, self.compression_level)
+            if self.segment_fp.tell() > 0 and self.segment_fp.tell() + len(data) > self.segment_size:
+                self._sync(self.segment_fp)
+                self.segment_fp.close()
+                self.segment = self.segment + 1
+                self.segment_fp = open(_get_segment_path(self.file_path, self.segment), 'ab')
+            offset = self.segment_fp.tell()
+            self.segment_fp.write(data)
+            self.index[digest] = (self.segment, offset, len(data))
+            self.index_fp.write(INDEX_RECORD.pack(digest, self.segment, offset, len(data)))
+            self.count = self.count + 1
+        return digest.hex()
+
+    @staticmethod
+    def _sync(fp):
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    def checkpoint(self):
+        """
+        Flush all values stored so far to disk, the segments before the index that refers to them.
+        :return: Size of the index.
+        """
+        self._sync(self.segment_fp)
+        self._sync(self.index_fp)
+        return self.index_fp.tell()
+
+    def close(self):
+        if not self.index_fp.closed:
+            self.checkpoint()
+            self.segment_fp.close()
+            self.index_fp.close()
+
+
+class BlobReader(object):
+    """
+    Reads values from a blob store, the segment files are memory-mapped so that only the pages of the values that
+    are read are loaded.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = _read_index(directory)
+        self.segments = {}
+
+    def get(self, content_hash):
+        """
+        :param content_hash: Hexadecimal SHA-256 hash of the value (as written to the export files).
+        :return: The value or None if it is not stored.
+        """
+        entry = self.index.get(bytes.fromhex(content_hash))
+        if entry is None:
+            return None
+        segment, offset, length = entry
+        data = self.segments.get(segment)
+        if data is None:
+            with open(_get_segment_path(self.directory, segment), 'rb') as fp:
+                data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self.segments[segment] = data
+        return zlib.decompress(data[offset:offset + length]).decode('utf8')
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        for data in self.segments.values():
+            data.close()
+        self.segments = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,102 @@
+""" Transparent compression of input and export files, detected by the file extension. """
+
+import gzip
+import io
+import zlib
+
+from util.exceptions import IllegalConfigurationError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# supported compressions (file extensions)
+COMPRESSIONS = ("gz", "zst")
+
+# compression levels used if none is configured
+DEFAULT_LEVELS = {"gz": 6, "zst": 3}
+
+# size of the buffers between the text layer, the compressor, and the file
+BUFFER_SIZE = 256 * 1024
+
+
+def get_compression(file_path):
+    """
+    :return: Compression of a file according to its extension ("gz" or "zst") or None if it is not compressed.
+    """
+    for compression in COMPRESSIONS:
+        if file_path.endswith("." + compression):
+            return compression
+    return None
+
+
+def strip_compression_extension(filename):
+    compression = get_compression(filename)
+    return filename[:-len(compression) - 1] if compression else filename
+
+
+def open_text_input(file_path):
+    """
+    Open a UTF-8 encoded text file that may be compressed for reading.
+    """
+    compression = get_compression(file_path)
+    if compression == "gz":
+        # reads all members of files written with several members
+        stream = gzip.open(file_path, 'rb')
+    elif compression == "zst":
+        _require_zstandard()
+        reader = zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), read_across_frames=True)
+        stream = io.BufferedReader(reader, BUFFER_SIZE)
+    else:
+        stream = open(file_path, 'rb', buffering=BUFFER_SIZE)
+    return io.TextIOWrapper(stream, encoding='utf8', newline='')
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise IllegalConfigurationError("The zst compression requires the optional package zstandard.")
+
+
+class CompressingStream(io.RawIOBase):
+    """
+    Writable binary stream that compresses the written data into a file.
+    end_member() completes the current gzip member or zstd frame. As a file may consist of several members/frames,
+    it can be truncated after any completed one and still be read completely.
+    """
+
+    def __init__(self, fp, compression, level=None):
+        if compression == "zst":
+            _require_zstandard()
+        elif compression != "gz":
+            raise IllegalConfigurationError("Unknown compression: " + str(compression))
+        self.fp = fp
+        self.compression = compression
+        self.level = int(level) if level is not None else DEFAULT_LEVELS[compression]
+        self.compressor = None
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.compressor is None:
+            self.compressor = self._create_compressor()
+        self.fp.write(self.compressor.compress(data))
+        return len(data)
+
+    def end_member(self):
+        if self.compressor is not None:
+            self.fp.write(self.compressor.flush())
+            self.compressor = None
+
+    def _create_compressor(self):
+        if self.compression == "gz":
+            # a complete gzip member with header and trailer
+            return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def close(self):
+        if not self.closed:
+            self.end_member()
+            self.fp.close()
+        super().close()
@@ -0,0 +1,213 @@
+""" On-disk cache for HTTP responses. """
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+logger = logging.getLogger("github-retriever_logger")
+
+# once the cache has grown beyond its maximum size, entries are evicted until it is down to this fraction of it
+EVICTION_TARGET = 0.9
+
+
+class ResponseCache(object):
+    """
+    Content-addressed cache that stores response bodies together with their ETag and Last-Modified headers.
+    Entries are addressed by the SHA-256 hash of their URI. Fresh entries (younger than the TTL) are served
+    without sending a request, stale entries are revalidated with a conditional request.
+    If the cache grows beyond its maximum size, the least recently used entries are evicted. The order in which
+    entries have been used is kept in memory, it is only read from the modification times of the bodies at startup.
+    """
+
+    def __init__(self, cache_dir, ttl=86400, max_size=1024 * 1024 * 1024, offline=False):
+        """
+        :param cache_dir: Directory in which the cached responses are stored.
+        :param ttl: Number of seconds for which a cached response is used without revalidating it.
+        :param max_size: Maximum size of all cached response bodies in bytes.
+        :param offline: Only serve cached responses, regardless of their age, and never send requests.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.lock = threading.Lock()
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        # body path -> size of all entries, from the least to the most recently used one
+        self.entries = OrderedDict((entry.body_path, entry.size) for entry in
+                                   sorted(self._entries(), key=lambda cache_entry: cache_entry.last_used))
+        self.size = sum(self.entries.values())
+
+    def lookup(self, uri):
+        """
+        Get the cached response for a URI.
+        :param uri: Requested URI.
+        :return: CacheEntry or None if the URI has not been cached.
+        """
+        body_path, meta_path = self._paths(uri)
+        try:
+            with open(meta_path, encoding='utf8') as fp:
+                meta = json.load(fp)
+            # mark entry as recently used (the modification time keeps the order for the next run)
+            os.utime(body_path)
+        except (OSError, ValueError):
+            return None
+        with self.lock:
+            if body_path in self.entries:
+                self.entries.move_to_end(body_path)
+        return CacheEntry(uri, body_path, meta_path, meta)
+
+    def is_fresh(self, entry):
+        return time.time() - entry.meta["stored_at"] < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.meta.get("etag"):
+            headers["If-None-Match"] = entry.meta["etag"]
+        if entry.meta.get("last_modified"):
+            headers["If-Modified-Since"] = entry.meta["last_modified"]
+        return headers
+
+    def store(self, uri, response):
+        """
+        Store a successful response.
+        """
+        body_path, meta_path = self._paths(uri)
+        meta = {
+            "uri": uri,
+            "url": str(response.url),
+            "status_code": response.status_code,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "stored_at": time.time()
+        }
+        directory = os.path.dirname(body_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        with self.lock:
+            previous_size = self.entries.pop(body_path, 0)
+            # write to temporary files first, so that concurrent readers never see partial entries
+            _write_atomically(body_path, response.content, 'wb')
+            _write_atomically(meta_path, json.dumps(meta), 'w')
+            self.entries[body_path] = len(response.content)
+            self.size = self.size - previous_size + len(response.content)
+            if self.size > self.max_size:
+                self._evict()
+
+    def invalidate(self, uri):
+        """
+        Remove the cached response for a URI, e.g., because it was incomplete and has to be requested again.
+        """
+        body_path, meta_path = self._paths(uri)
+        with self.lock:
+            self.size = self.size - self.entries.pop(body_path, 0)
+            _remove_files(body_path, meta_path)
+
+    def refresh(self, entry):
+        """
+        Mark an entry as fresh after it has been revalidated by the server.
+        """
+        entry.meta["stored_at"] = time.time()
+        with self.lock:
+            _write_atomically(entry.meta_path, json.dumps(entry.meta), 'w')
+
+    def _evict(self):
+        # evicting below the maximum size leaves room for further responses before the next eviction
+        while self.entries and self.size > self.max_size * EVICTION_TARGET:
+            body_path, size = self.entries.popitem(last=False)
+            _remove_files(body_path, body_path[:-len(".body")] + ".json")
+            self.size = self.size - size
+        logger.info("Evicted least recently used responses from cache, current size: %s bytes.", self.size)
+
+    def _entries(self):
+        for directory, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith(".body"):
+                    path = os.path.join(directory, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield _EvictionCandidate(path, path[:-len(".body")] + ".json", stat.st_size, stat.st_mtime)
+
+    def _paths(self, uri):
+        key = hashlib.sha256(uri.encode('utf8')).hexdigest()
+        base_path = os.path.join(self.cache_dir, key[:2], key)
+        return base_path + ".body", base_path + ".json"
+
+
+class CacheEntry(object):
+    """ A response stored in the cache. """
+
+    def __init__(self, uri, body_path, meta_path, meta):
+        self.uri = uri
+        self.body_path = body_path
+        self.meta_path = meta_path
+        self.meta = meta
+
+    def get_response(self):
+        try:
+            with open(self.body_path, 'rb') as fp:
+                content = fp.read()
+        except OSError:
+            return None
+        headers = {}
+        if self.meta.get("etag"):
+            headers["ETag"] = self.meta["etag"]
+        if self.meta.get("last_modified"):
+            headers["Last-Modified"] = self.meta["last_modified"]
+        return CachedResponse(self.meta.get("url", self.uri), self.meta["status_code"], headers, content)
+
+
+class CachedResponse(object):
+    """ Response served from the cache, can be used like a response from the requests package. """
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.ok = status_code < 400
+        self.from_cache = True
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __bool__(self):
+        return self.ok
+
+
+class _EvictionCandidate(object):
+
+    def __init__(self, body_path, meta_path, size, last_used):
+        self.body_path = body_path
+        self.meta_path = meta_path
+        self.size = size
+        self.last_used = last_used
+
+
+def _remove_files(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _write_atomically(path, data, mode):
+    temp_path = path + "." + str(threading.get_ident()) + ".tmp"
+    with open(temp_path, mode, encoding=None if 'b' in mode else 'utf8') as fp:
+        fp.write(data)
+    os.replace(temp_path, path)
@@ -1,16 +1,34 @@
 """ Global logger. """
 
+import atexit
+import datetime
+import json
 import logging
+import queue
+import threading
+import time
+
+from logging.handlers import QueueHandler, QueueListener
+
+# number of warnings and errors with the same message that are logged per interval
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_INTERVAL = 60.0
+
+# writes the log records of all threads to the configured handlers in the background
+_listener = None
 
 
 def configure_logger(name, log_file):
     """
     Configure a named global logger.
+    Log records are put into a queue and written to the console and the log file by a background thread,
+    so that formatting and writing them does not slow down the threads that retrieve data.
     (see also [1])
     :param name: Name of global logger.
     :param log_file: Path to log file for FileHandler.
     [1]: http://stackoverflow.com/a/7622029
     """
+    global _listener
 
     logger = logging.getLogger(name)  # name is None => returns root logger
 
@@ -26,8 +44,101 @@ def configure_logger(name, log_file):
     file_handler.setFormatter(log_formatter)
     file_handler.setLevel(logging.DEBUG)
 
+    queue_handler = _DeferredQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RateLimitFilter())
+
     logger.setLevel(logging.DEBUG)
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    logger.addHandler(queue_handler)
+
+    _listener = QueueListener(queue_handler.queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
 
     return logger
+
+
+def add_json_log(log_file):
+    """
+    Additionally write all log records to a file with one JSON object per line.
+    :param log_file: Path to the JSONL log file.
+    """
+    json_handler = logging.FileHandler(log_file)
+    json_handler.setFormatter(JsonFormatter())
+    json_handler.setLevel(logging.DEBUG)
+    _add_handler(json_handler)
+
+
+def _add_handler(handler):
+    # the handlers of a listener can only be changed while it is stopped
+    _listener.stop()
+    _listener.handlers = _listener.handlers + (handler,)
+    _listener.start()
+
+
+def stop_logging():
+    """
+    Write all queued log records and stop the background thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Puts log records into a queue without formatting them first, the queue is only consumed in this process.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most burst warnings and errors with the same message (before the arguments are merged) pass per
+    interval, the number of suppressed messages is appended to the first message of the next interval.
+    """
+
+    def __init__(self, burst=RATE_LIMIT_BURST, interval=RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.lock = threading.Lock()
+        # (level, message) -> [start of interval, logged messages, suppressed messages]
+        self.intervals = {}
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.levelno, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            state = self.intervals.get(key)
+            if state is None or now - state[0] >= self.interval:
+                suppressed = state[2] if state else 0
+                self.intervals[key] = [now, 1, 0]
+                if suppressed > 0:
+                    record.msg = str(record.msg) + " (" + str(suppressed) + " similar messages suppressed)"
+                return True
+            if state[1] < self.burst:
+                state[1] = state[1] + 1
+                return True
+            state[2] = state[2] + 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """ Formats a log record as a JSON object. """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
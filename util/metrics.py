@@ -0,0 +1,192 @@
+""" Counters and latency histograms for the stages of a run. """
+
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+from util.exceptions import IllegalArgumentError
+
+logger = logging.getLogger("github-retriever_logger")
+
+# upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# stages shown in the progress summary
+SUMMARY_STAGES = ("throttle", "fetch", "parse", "extract", "write")
+
+
+class Histogram(object):
+    """ Latency histogram with fixed buckets. """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds):
+        self.count = self.count + 1
+        self.sum = self.sum + seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] = self.buckets[index] + 1
+                break
+
+    def to_dict(self):
+        return {"count": self.count, "sum": round(self.sum, 6), "max": round(self.max, 6),
+                "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS], self.buckets))}
+
+
+class Metrics(object):
+    """
+    Thread-safe registry of counters (e.g., requests, bytes downloaded, cache hits) and latency histograms
+    for the stages fetch, parse, extract, and write (and the time spent waiting for the rate limiter).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.start_time = time.monotonic()
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def get_counter(self, name):
+        with self.lock:
+            return self.counters.get(name, 0)
+
+    def get_histogram(self, name):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            return histogram.to_dict() if histogram else Histogram().to_dict()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.start_time = time.monotonic()
+
+    def summary(self):
+        """
+        :return: One-line summary of the progress and of the time spent per stage.
+        """
+        with self.lock:
+            elapsed = time.monotonic() - self.start_time
+            requests = self.counters.get("requests", 0)
+            parts = [
+                "repos: " + str(self.counters.get("repos_completed", 0))
+                + " (" + str(self.counters.get("repos_failed", 0)) + " failed)",
+                "requests: " + str(requests) + " (" + str(round(requests / elapsed, 1) if elapsed > 0 else 0) + "/s)",
+                "MB downloaded: " + str(round(self.counters.get("bytes_downloaded", 0) / 1024 / 1024, 1)),
+                "cache hits: " + str(self.counters.get("cache_hits", 0)),
+                "retries: " + str(self.counters.get("retries", 0))
+            ]
+            if "discussions_unchanged" in self.counters:
+                # incremental runs only
+                parts.append("unchanged discussions: " + str(self.counters["discussions_unchanged"]))
+            for stage in SUMMARY_STAGES:
+                histogram = self.histograms.get(stage)
+                if histogram and histogram.count > 0:
+                    parts.append(stage + ": " + str(round(histogram.sum, 1)) + " s (avg "
+                                 + str(round(histogram.sum / histogram.count * 1000, 1)) + " ms)")
+        return ", ".join(parts)
+
+    def to_json(self):
+        with self.lock:
+            return json.dumps({
+                "elapsed_seconds": round(time.monotonic() - self.start_time, 3),
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+            }, indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = "github_retriever_" + name + "_total"
+                lines.append("# TYPE " + metric + " counter")
+                lines.append(metric + " " + str(value))
+            for name, histogram in sorted(self.histograms.items()):
+                metric = "github_retriever_" + name + "_seconds"
+                lines.append("# TYPE " + metric + " histogram")
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                    cumulative = cumulative + count
+                    lines.append(metric + '_bucket{le="' + str(bound) + '"} ' + str(cumulative))
+                lines.append(metric + '_bucket{le="+Inf"} ' + str(histogram.count))
+                lines.append(metric + "_sum " + str(round(histogram.sum, 6)))
+                lines.append(metric + "_count " + str(histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, file_path):
+        """
+        Write all metrics to a file, as JSON if the file name ends with .json and in the Prometheus text format
+        otherwise.
+        """
+        content = self.to_json() if file_path.endswith(".json") else self.to_prometheus()
+        temp_path = file_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf8') as fp:
+            fp.write(content)
+        os.replace(temp_path, file_path)
+
+
+class MetricsReporter(object):
+    """
+    Background thread that periodically logs a progress summary and dumps the metrics to a file.
+    With an interval of 0, no thread is started and the metrics are only reported when the reporter is stopped.
+    """
+
+    def __init__(self, metrics, interval, file_path=None):
+        if interval < 0:
+            raise IllegalArgumentError("The metrics interval must not be negative.")
+        self.metrics = metrics
+        self.interval = interval
+        self.file_path = file_path
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+
+    def start(self):
+        if self.interval > 0:
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.report()
+
+    def report(self):
+        logger.info("Progress: %s", self.metrics.summary())
+        if self.file_path:
+            self.metrics.dump(self.file_path)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+
+# global registry used by all components
+metrics = Metrics()
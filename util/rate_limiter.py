@@ -0,0 +1,144 @@
+""" Token bucket rate limiter shared by all HTTP requests. """
+
+import asyncio
+import email.utils
+import logging
+import threading
+import time
+
+from util.exceptions import IllegalArgumentError
+
+logger = logging.getLogger("github-retriever_logger")
+
+# status codes GitHub uses to signal that we are sending too many requests
+RATE_LIMIT_STATUS_CODES = (429, 503)
+
+
+class RateLimiter(object):
+    """
+    Token bucket that limits the global request frequency.
+    Tokens are refilled with the configured number of requests per second up to the configured burst size.
+    If the server signals that we are rate limited (429/503), no tokens are handed out until the time
+    requested in the Retry-After header (or an exponentially growing backoff) has passed. Requests that are waiting
+    for the end of the block are scheduled one token interval apart afterwards instead of all at once, requests that
+    have already been waiting for their token when the block starts are rescheduled after it as well.
+    """
+
+    def __init__(self, requests_per_second=2.0, burst=4, initial_backoff=1.0, max_backoff=300.0):
+        if requests_per_second <= 0:
+            raise IllegalArgumentError("Requests per second must be positive.")
+        if burst < 1:
+            raise IllegalArgumentError("Burst size must be at least 1.")
+
+        self.requests_per_second = float(requests_per_second)
+        self.burst = int(burst)
+        self.initial_backoff = float(initial_backoff)
+        self.max_backoff = float(max_backoff)
+
+        self.tokens = float(self.burst)
+        self.last_refill = time.monotonic()
+        self.backoff = 0.0
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until the next request may be sent.
+        """
+        delay = self.reserve()
+        while delay > 0:
+            time.sleep(delay)
+            delay = self.reserve_if_blocked()
+
+    async def acquire_async(self):
+        """
+        Wait until the next request may be sent without blocking the event loop.
+        """
+        delay = self.reserve()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.reserve_if_blocked()
+
+    def reserve(self):
+        """
+        Take one token from the bucket.
+        :return: Number of seconds the caller has to wait before sending its request.
+        """
+        with self.lock:
+            return self._reserve(time.monotonic())
+
+    def reserve_if_blocked(self):
+        """
+        Take a new token if requests have been blocked while the caller was waiting for its token.
+        :return: Number of seconds the caller has to wait (again) before sending its request.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now >= self.blocked_until:
+                return 0.0
+            # the token of the caller falls into the block, it gets a new one after the block
+            return self._reserve(now)
+
+    def _reserve(self, now):
+        self._refill(now)
+        self.tokens = self.tokens - 1
+        # the bucket starts to refill again at the end of a block
+        delay = max(0.0, self.last_refill - now)
+        if self.tokens < 0:
+            delay = delay + -self.tokens / self.requests_per_second
+        return delay
+
+    def report(self, status_code, retry_after=None):
+        """
+        Adapt the request frequency to the response of the server.
+        :param status_code: HTTP status code of the response.
+        :param retry_after: Value of the Retry-After header (if any).
+        :return: True if the response signals that we have been rate limited.
+        """
+        with self.lock:
+            if status_code not in RATE_LIMIT_STATUS_CODES:
+                # recover gradually after a phase of rate limiting
+                self.backoff = self.backoff / 2 if self.backoff >= 2 * self.initial_backoff else 0.0
+                return False
+
+            self.backoff = min(self.max_backoff, max(self.initial_backoff, self.backoff * 2))
+            delay = parse_retry_after(retry_after)
+            if delay is None:
+                delay = self.backoff
+            now = time.monotonic()
+            self._refill(now)
+            self.blocked_until = max(self.blocked_until, now + delay)
+            # no tokens are refilled during the block, the next token slots follow its end (waiting requests whose
+            # tokens fall into the block take new ones, so their previous reservations are dropped)
+            self.tokens = 0.0
+            self.last_refill = self.blocked_until
+            logger.warning("Rate limited (status %s), pausing requests for %s seconds.", status_code, round(delay, 2))
+            return True
+
+    def _refill(self, now):
+        # the time of the last refill lies in the future while requests are blocked
+        if now <= self.last_refill:
+            return
+        elapsed = now - self.last_refill
+        self.tokens = min(float(self.burst), self.tokens + elapsed * self.requests_per_second)
+        self.last_refill = now
+
+
+def parse_retry_after(value):
+    """
+    Parse the value of a Retry-After header, which is either a number of seconds or an HTTP date.
+    :param value: Header value.
+    :return: Number of seconds to wait or None if the value could not be parsed.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_date is None:
+        return None
+    return max(0.0, retry_date.timestamp() - time.time())
@@ -1,11 +1,269 @@
 """ Helper functions for HTTP requests. """
 
-from random import randint
+import asyncio
+import logging
+import os
+import threading
 
-import time
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
+from requests.adapters import HTTPAdapter
 
-def delay_next_request():
-    # reduce request frequency to prevent getting blocked
-    delay_ms = randint(100, 1000)
-    time.sleep(delay_ms / 1000)
+from util.exceptions import IllegalConfigurationError
+from util.http_cache import CachedResponse
+from util.metrics import metrics
+from util.rate_limiter import RateLimiter
+from util.retry import RetryPolicy
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger("github-retriever_logger")
+
+# number of times a request is repeated if the server signals that we are rate limited
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class HttpClient(object):
+    """
+    HTTP client shared by all repos and discussions.
+    Connections are pooled and kept alive so that the TLS handshake with github.com is only done once per
+    connection, and every request passes through the global rate limiter.
+    If a response cache is configured, cached responses are served or revalidated with conditional requests.
+    The retry policy is shared as well and used by repos and discussions to retry failed requests.
+    """
+
+    def __init__(self, pool_size=10, http2=False, rate_limiter=None, cache=None, retry_policy=None):
+        self.pool_size = int(pool_size)
+        self.http2 = http2
+        self.rate_limiter = rate_limiter if rate_limiter else RateLimiter()
+        self.cache = cache
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self.retry_policy.cache = cache
+
+        if http2:
+            if httpx is None:
+                raise IllegalConfigurationError("HTTP/2 requires the optional package httpx[http2].")
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            self.session = httpx.Client(http2=True, limits=limits, follow_redirects=True)
+        else:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
+
+    def get(self, uri, stream=False):
+        """
+        Send a GET request once the rate limiter permits it.
+        :param uri: URI to retrieve.
+        :param stream: Do not download the body before returning the response, it can then be read with
+        iter_content() and the response has to be closed afterwards. Streamed responses are not cached.
+        :return: Response with the attributes ok, status_code, headers, url, and content.
+        """
+        cached_response, entry, headers = self.lookup_cache(uri)
+        if cached_response is not None:
+            return cached_response
+
+        response = self._send(uri, headers, stream)
+        retries = 0
+        while self.rate_limiter.report(response.status_code, response.headers.get("Retry-After")) \
+                and retries < MAX_RATE_LIMIT_RETRIES:
+            retries = retries + 1
+            metrics.increment("rate_limited")
+            metrics.increment("retries")
+            response.close()
+            response = self._send(uri, headers, stream)
+        return self.update_cache(uri, response, entry, stream)
+
+    def lookup_cache(self, uri):
+        """
+        :return: Tuple (cached_response, entry, headers) with the cached response if it can be used without
+        sending a request, the cache entry to revalidate, and the headers for a conditional request.
+        """
+        if not self.cache:
+            return None, None, {}
+        entry = self.cache.lookup(uri)
+        cached_response = entry.get_response() if entry else None
+        if cached_response is None:
+            metrics.increment("cache_misses")
+            if self.cache.offline:
+                # like a request with Cache-Control: only-if-cached
+                return CachedResponse(uri, 504, {}, b""), None, {}
+            return None, None, {}
+        if self.cache.offline or self.cache.is_fresh(entry):
+            metrics.increment("cache_hits")
+            return cached_response, entry, {}
+        return None, entry, self.cache.conditional_headers(entry)
+
+    def update_cache(self, uri, response, entry, stream):
+        """
+        Store a retrieved response in the cache or refresh the revalidated entry.
+        :return: Response to return to the caller.
+        """
+        if self.cache:
+            if response.status_code == 304 and entry:
+                metrics.increment("cache_revalidations")
+                self.cache.refresh(entry)
+                return entry.get_response()
+            if response.ok and not stream:
+                self.cache.store(uri, response)
+        return response
+
+    def _send(self, uri, headers, stream):
+        with metrics.timer("throttle"):
+            self.rate_limiter.acquire()
+        metrics.increment("requests")
+        # report all transport errors as the built-in ConnectionError handled by the callers
+        try:
+            with metrics.timer("fetch"):
+                if self.http2:
+                    # the httpx client always reads the whole body
+                    response = Http2Response(self.session.get(uri, headers=headers))
+                else:
+                    response = self.session.get(uri, headers=headers, stream=stream)
+        except requests.exceptions.RequestException as e:
+            metrics.increment("connection_errors")
+            raise ConnectionError(str(e)) from e
+        except Exception as e:
+            if httpx is not None and isinstance(e, httpx.TransportError):
+                metrics.increment("connection_errors")
+                raise ConnectionError(str(e)) from e
+            raise
+        metrics.increment("responses_" + str(response.status_code))
+        if not stream:
+            metrics.increment("bytes_downloaded", len(response.content))
+        return response
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncHttpClient(object):
+    """
+    Asynchronous HTTP client based on httpx.AsyncClient, used to retrieve many discussion threads concurrently.
+    The client runs its own event loop in a background thread, coroutines are submitted with run().
+    At most `concurrency` requests are in flight and CPU-bound work (parsing) is offloaded to a thread pool
+    with run_in_executor(), so that the event loop is never blocked.
+    The rate limiter, cache, and retry policy are shared with the synchronous client.
+    """
+
+    def __init__(self, client, concurrency=10, parse_workers=None):
+        if httpx is None:
+            raise IllegalConfigurationError("The asyncio backend requires the optional package httpx.")
+        self.client = client
+        self.rate_limiter = client.rate_limiter
+        self.retry_policy = client.retry_policy
+        self.concurrency = int(concurrency)
+
+        self.executor = ThreadPoolExecutor(max_workers=parse_workers if parse_workers else os.cpu_count(),
+                                           thread_name_prefix="parser")
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="asyncio-client", daemon=True)
+        self.thread.start()
+        self.semaphore = None
+        self.session = self.run(self._open())
+
+    async def _open(self):
+        # the semaphore and the connection pool are bound to the event loop of the client
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        return httpx.AsyncClient(http2=self.client.http2, limits=limits, follow_redirects=True,
+                                 headers={"Connection": "keep-alive"})
+
+    def run(self, coroutine):
+        """
+        Run a coroutine in the event loop of the client and wait for its result (may be called from any thread).
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def run_in_executor(self, function, *args):
+        return await self.loop.run_in_executor(self.executor, function, *args)
+
+    async def get(self, uri, stream=False):
+        """
+        Send a GET request once the rate limiter permits it.
+        :param uri: URI to retrieve.
+        :param stream: The response is going to be parsed while reading it with iter_content() (the body is always
+        downloaded completely, but not counted as downloaded and not cached).
+        :return: Response with the attributes ok, status_code, headers, url, and content.
+        """
+        cached_response, entry, headers = await self._run_cache_operation(self.client.lookup_cache, uri)
+        if cached_response is not None:
+            return cached_response
+
+        response = await self._send(uri, headers, stream)
+        retries = 0
+        while self.rate_limiter.report(response.status_code, response.headers.get("Retry-After")) \
+                and retries < MAX_RATE_LIMIT_RETRIES:
+            retries = retries + 1
+            metrics.increment("rate_limited")
+            metrics.increment("retries")
+            response = await self._send(uri, headers, stream)
+        return await self._run_cache_operation(self.client.update_cache, uri, response, entry, stream)
+
+    async def _run_cache_operation(self, function, *args):
+        # reading and writing the cache (including evictions) blocks, it is done in the default thread pool of the
+        # event loop, so that it does not delay other requests or compete with parsing
+        if self.client.cache is None:
+            return function(*args)
+        return await self.loop.run_in_executor(None, function, *args)
+
+    async def _send(self, uri, headers, stream):
+        async with self.semaphore:
+            with metrics.timer("throttle"):
+                await self.rate_limiter.acquire_async()
+            metrics.increment("requests")
+            try:
+                with metrics.timer("fetch"):
+                    response = Http2Response(await self.session.get(uri, headers=headers))
+            except httpx.TransportError as e:
+                metrics.increment("connection_errors")
+                raise ConnectionError(str(e)) from e
+        metrics.increment("responses_" + str(response.status_code))
+        if not stream:
+            metrics.increment("bytes_downloaded", len(response.content))
+        return response
+
+    def close(self):
+        self.run(self.session.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class Http2Response(object):
+    """ Wraps an httpx response so that it can be used like a response from the requests package. """
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.content = response.content
+        self.ok = response.status_code < 400
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __bool__(self):
+        return self.ok
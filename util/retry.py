@@ -0,0 +1,167 @@
+""" Retry policy for requests to GitHub. """
+
+import asyncio
+import logging
+import random
+import time
+
+from util.exceptions import IllegalArgumentError
+from util.metrics import metrics
+
+logger = logging.getLogger("github-retriever_logger")
+
+# outcomes of a request
+SUCCESS = "success"
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+# the requested resource does not exist (anymore) or is not available, retrying does not help
+PERMANENT_STATUS_CODES = frozenset([404, 410, 451])
+
+# timeouts and rate limits, server errors are transient as well
+TRANSIENT_STATUS_CODES = frozenset([408, 425, 429])
+
+
+def classify(response):
+    """
+    Classify the response to a request.
+    :param response: Response or None if the request failed because of a connection error.
+    :return: SUCCESS, TRANSIENT (worth retrying), or PERMANENT.
+    """
+    if response is None:
+        return TRANSIENT
+    if response.ok:
+        return SUCCESS
+    if response.status_code in PERMANENT_STATUS_CODES:
+        return PERMANENT
+    if response.status_code in TRANSIENT_STATUS_CODES or response.status_code >= 500:
+        return TRANSIENT
+    return PERMANENT
+
+
+class Failure(object):
+    """ A request that could not be completed. """
+
+    __slots__ = ("uri", "status_code", "permanent", "attempts")
+
+    def __init__(self, uri, status_code, permanent, attempts):
+        self.uri = uri
+        # None if the request failed because of a connection error
+        self.status_code = status_code
+        self.permanent = permanent
+        self.attempts = attempts
+
+    def get_column_values(self, repo_name):
+        return [repo_name, self.uri, self.status_code if self.status_code else "n/a",
+                PERMANENT if self.permanent else TRANSIENT, self.attempts]
+
+    @classmethod
+    def get_column_names(cls):
+        return ["repo_name", "uri", "status_code", "reason", "attempts"]
+
+    def __str__(self):
+        return (self.uri + " (status code: " + str(self.status_code) + ", "
+                + (PERMANENT if self.permanent else TRANSIENT) + ", attempts: " + str(self.attempts) + ")")
+
+
+class RetryPolicy(object):
+    """
+    Retries transient failures with an exponential backoff and full jitter,
+    i.e., the n-th retry waits a random time between zero and min(max_delay, initial_delay * 2^(n-1)) seconds.
+    Permanent failures (e.g., 404) are not retried.
+    """
+
+    def __init__(self, max_attempts=3, initial_delay=1.0, max_delay=60.0):
+        if max_attempts < 1:
+            raise IllegalArgumentError("At least one attempt is required.")
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        # response cache of the client that sends the requests (set by the client), responses that are rejected
+        # by the process function are removed from it, so that they are not served again when retrying
+        self.cache = None
+
+    def get_delay(self, attempt):
+        """
+        :param attempt: Number of the failed attempt (starting with 1).
+        :return: Seconds to wait before the next attempt.
+        """
+        return random.uniform(0, min(self.max_delay, self.initial_delay * 2 ** (attempt - 1)))
+
+    def execute(self, uri, request, process=None):
+        """
+        Send a request until it succeeds, fails permanently, or the maximum number of attempts has been reached.
+        Responses of failed attempts are closed.
+        :param uri: URI of the request (used for logging).
+        :param request: Function that sends the request and returns the response.
+        :param process: Optional function that processes a successful response and returns False if the response
+                        was incomplete and should be requested again (it is then removed from the cache).
+        :return: Tuple (response, failure) with failure being None if the request succeeded.
+        """
+        attempt = 0
+        while True:
+            attempt = attempt + 1
+            response = None
+            try:
+                response = request()
+            except ConnectionError:
+                logger.error("An error occurred while accessing: %s", uri)
+
+            outcome = classify(response)
+            if outcome == SUCCESS and process is not None and not process(response):
+                self._reject(uri)
+                outcome = TRANSIENT
+            if outcome == SUCCESS:
+                return response, None
+
+            failure, delay = self._handle_failure(uri, attempt, response, outcome)
+            if failure:
+                return response, failure
+            time.sleep(delay)
+
+    async def execute_async(self, uri, request, process=None):
+        """
+        Like execute(), but request and process are coroutine functions and the delays do not block the event loop.
+        """
+        attempt = 0
+        while True:
+            attempt = attempt + 1
+            response = None
+            try:
+                response = await request()
+            except ConnectionError:
+                logger.error("An error occurred while accessing: %s", uri)
+
+            outcome = classify(response)
+            if outcome == SUCCESS and process is not None and not await process(response):
+                if self.cache:
+                    # removing the cache entry blocks, the event loop keeps running in the meantime
+                    await asyncio.get_running_loop().run_in_executor(None, self._reject, uri)
+                outcome = TRANSIENT
+            if outcome == SUCCESS:
+                return response, None
+
+            failure, delay = self._handle_failure(uri, attempt, response, outcome)
+            if failure:
+                return response, failure
+            await asyncio.sleep(delay)
+
+    def _reject(self, uri):
+        if self.cache:
+            self.cache.invalidate(uri)
+
+    def _handle_failure(self, uri, attempt, response, outcome):
+        """
+        :return: Tuple (failure, delay), failure is None if the request should be repeated after delay seconds.
+        """
+        if response is not None:
+            response.close()
+        status_code = response.status_code if response is not None else None
+        if outcome == PERMANENT or attempt >= self.max_attempts:
+            return Failure(uri, status_code, outcome == PERMANENT, attempt), None
+
+        delay = self.get_delay(attempt)
+        metrics.increment("retries")
+        logger.warning("Attempt %s failed (status code: %s), retrying %s in %s seconds...",
+                       attempt, status_code, uri, round(delay, 1))
+        return None, delay
@@ -0,0 +1,134 @@
+""" Persistent progress of a run, used to resume interrupted runs. """
+
+import logging
+import os
+import sqlite3
+import time
+
+from util.exceptions import IllegalArgumentError
+
+logger = logging.getLogger("github-retriever_logger")
+
+DONE = "done"
+FAILED = "failed"
+
+
+class StateStore(object):
+    """
+    SQLite database that records which repos and discussions have been processed and how far each export
+    file had been written when the state was committed.
+    Rows and states are committed together at checkpoints, so that an interrupted run can be resumed from the
+    last checkpoint without losing or duplicating rows.
+    """
+
+    def __init__(self, file_path, resume=False):
+        self.file_path = file_path
+
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(file_path)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS repos "
+                                    "(repo_name TEXT PRIMARY KEY, status TEXT, updated_at REAL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS discussions "
+                                    "(uri TEXT PRIMARY KEY, repo_name TEXT, status TEXT, updated_at REAL, "
+                                    "marker TEXT)")
+            if "marker" not in self._get_column_names("main", "discussions"):
+                # progress databases written before change markers were recorded
+                self.connection.execute("ALTER TABLE discussions ADD COLUMN marker TEXT")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS discussions_repo_name ON discussions (repo_name)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS aliases (repo_name TEXT PRIMARY KEY, target TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS exports "
+                                    "(name TEXT PRIMARY KEY, file_path TEXT, file_offset INTEGER, row_count INTEGER)")
+            if not resume:
+                # a new run starts without progress, the alias map of earlier runs is kept
+                for table in ("repos", "discussions", "exports"):
+                    self.connection.execute("DELETE FROM " + table)
+
+    def get_repo_names(self, status):
+        cursor = self.connection.execute("SELECT repo_name FROM repos WHERE status = ?", (status,))
+        return set(row[0] for row in cursor)
+
+    def get_discussion_uris(self, status):
+        cursor = self.connection.execute("SELECT uri FROM discussions WHERE status = ?", (status,))
+        return set(row[0] for row in cursor)
+
+    def get_discussion_markers(self, repo_name):
+        """
+        Get the change markers of the completed discussions of a repo.
+        :return: Dictionary mapping discussion URIs to markers.
+        """
+        cursor = self.connection.execute("SELECT uri, marker FROM discussions "
+                                         "WHERE repo_name = ? AND status = ? AND marker IS NOT NULL",
+                                         (repo_name, DONE))
+        return dict(cursor.fetchall())
+
+    def get_aliases(self):
+        """
+        :return: Dictionary mapping lower-case names of renamed or transferred repos to their current names.
+        """
+        return dict(self.connection.execute("SELECT repo_name, target FROM aliases").fetchall())
+
+    def import_previous_run(self, file_path):
+        """
+        Import the completed discussions and the aliases of a previous run, entries already recorded in this run
+        are kept.
+        :param file_path: Path of the progress database of the previous run.
+        :return: Number of imported discussions.
+        """
+        if not os.path.exists(file_path):
+            raise IllegalArgumentError("Progress database not found: " + file_path)
+        self.connection.execute("ATTACH DATABASE ? AS previous", (file_path,))
+        try:
+            tables = [row[0] for row in self.connection.execute("SELECT name FROM previous.sqlite_master")]
+            if "aliases" in tables:
+                with self.connection:
+                    self.connection.execute("INSERT OR IGNORE INTO aliases SELECT repo_name, target "
+                                            "FROM previous.aliases")
+            if "marker" not in self._get_column_names("previous", "discussions"):
+                logger.warning("The previous run did not record any change markers: %s", file_path)
+                return 0
+            with self.connection:
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO discussions (uri, repo_name, status, updated_at, marker) "
+                    "SELECT uri, repo_name, status, updated_at, marker FROM previous.discussions "
+                    "WHERE status = ? AND marker IS NOT NULL", (DONE,))
+                return cursor.rowcount
+        finally:
+            self.connection.execute("DETACH DATABASE previous")
+
+    def _get_column_names(self, schema, table):
+        return [row[1] for row in self.connection.execute("PRAGMA " + schema + ".table_info(" + table + ")")]
+
+    def get_export(self, name):
+        """
+        Get the state of an export file at the last checkpoint.
+        :param name: Name of the export.
+        :return: Tuple (file_path, file_offset, row_count) or None if the export has not been committed yet.
+        """
+        cursor = self.connection.execute("SELECT file_path, file_offset, row_count FROM exports WHERE name = ?",
+                                         (name,))
+        return cursor.fetchone()
+
+    def commit(self, repos, discussions, exports, aliases=()):
+        """
+        Atomically record the states of processed repos and discussions together with the export files.
+        :param repos: List of tuples (repo_name, status).
+        :param discussions: List of tuples (uri, repo_name, status, marker).
+        :param exports: List of tuples (name, file_path, file_offset, row_count).
+        :param aliases: List of tuples (repo_name, target) with the lower-case name of a repo that redirects to target.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO repos VALUES (?, ?, ?)",
+                                        [(repo_name, status, now) for repo_name, status in repos])
+            self.connection.executemany("INSERT OR REPLACE INTO discussions VALUES (?, ?, ?, ?, ?)",
+                                        [(uri, repo_name, status, now, marker)
+                                         for uri, repo_name, status, marker in discussions])
+            self.connection.executemany("INSERT OR REPLACE INTO exports VALUES (?, ?, ?, ?)", exports)
+            self.connection.executemany("INSERT OR REPLACE INTO aliases VALUES (?, ?)", aliases)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,240 @@
+""" Incremental writers for exported rows. """
+
+import csv
+import datetime
+import io
+import json
+import os
+
+from util.compression import BUFFER_SIZE, CompressingStream, get_compression
+from util.exceptions import IllegalConfigurationError
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# supported formats of the export files
+FORMATS = ("csv", "jsonl", "parquet")
+
+# number of rows written to a Parquet file at once
+PARQUET_BATCH_SIZE = 10000
+
+
+def create_writer(file_format, file_path, column_names, column_types, delimiter, resume_offset=None, resume_count=0,
+                  compression_level=None):
+    """
+    Create a writer for the given format.
+    :param column_types: Type of each column (string, bool, int, timestamp, or reactions), only used by typed formats.
+    :param compression_level: Level of the compression of text files (see util.compression), which is determined by
+                              the extension of the file path.
+    """
+    if file_format == "csv":
+        return CsvWriter(file_path, column_names, delimiter, resume_offset, resume_count, compression_level)
+    if file_format == "jsonl":
+        return JsonlWriter(file_path, column_names, column_types, resume_offset, resume_count, compression_level)
+    if file_format == "parquet":
+        return ParquetWriter(file_path, column_names, column_types, resume_offset, resume_count)
+    raise IllegalConfigurationError("Unknown format: " + str(file_format))
+
+
+def convert_value(column_type, value):
+    """
+    Convert an exported value to the type of its column.
+    Missing values (None or "n/a") are converted to None.
+    """
+    if value is None or value == "n/a":
+        return None
+    if column_type == "bool":
+        return bool(value)
+    if column_type == "int":
+        return int(value)
+    if column_type == "timestamp":
+        try:
+            # GitHub uses ISO 8601 timestamps in UTC, e.g., 2020-06-03T18:41:10Z
+            return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if column_type == "reactions":
+        emojis, counts = value
+        return [{"emoji": str(emoji), "count": int(count)} for emoji, count in zip(emojis, counts)]
+    return str(value)
+
+
+class FileWriter(object):
+    """
+    Base class of writers for text files that stay open for the whole run.
+    Rows are only written once and flushed to disk at checkpoints, so that backups do not need to
+    rewrite the whole file.
+    Files whose path ends with .gz or .zst are compressed while they are written, each checkpoint completes a
+    gzip member or zstd frame, so that the file can be truncated to the offset of any checkpoint.
+    """
+
+    def __init__(self, file_path, resume_offset=None, resume_count=0, compression_level=None):
+        self.file_path = file_path
+        self.count = 0
+
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.resumed = resume_offset is not None and os.path.exists(file_path)
+        if self.resumed:
+            # discard rows written after the last checkpoint and continue after them
+            os.truncate(file_path, resume_offset)
+            self.raw = open(file_path, 'ab', buffering=BUFFER_SIZE)
+            self.count = resume_count
+        else:
+            self.raw = open(file_path, 'wb', buffering=BUFFER_SIZE)
+
+        compression = get_compression(file_path)
+        self.stream = CompressingStream(self.raw, compression, compression_level) if compression else None
+        buffer = io.BufferedWriter(self.stream, BUFFER_SIZE) if self.stream else self.raw
+        self.fp = io.TextIOWrapper(buffer, encoding='utf8', newline='')
+
+    def checkpoint(self):
+        """
+        Flush all rows written so far to disk.
+        :return: Offset up to which the file has been written.
+        """
+        self.fp.flush()
+        if self.stream:
+            self.stream.end_member()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        return self.raw.tell()
+
+    def close(self):
+        if not self.fp.closed:
+            self.checkpoint()
+            self.fp.close()
+
+
+class CsvWriter(FileWriter):
+    """ Writes rows to a UTF-8 encoded CSV file. """
+
+    def __init__(self, file_path, column_names, delimiter, resume_offset=None, resume_count=0, compression_level=None):
+        super().__init__(file_path, resume_offset, resume_count, compression_level)
+        self.column_names = column_names
+        self.delimiter = delimiter
+        self.writer = csv.writer(self.fp, delimiter=delimiter)
+        if not self.resumed:
+            self.writer.writerow(column_names)
+
+    def write_row(self, row):
+        self.writer.writerow(row)
+        self.count = self.count + 1
+
+
+class JsonlWriter(FileWriter):
+    """
+    Writes each row as a JSON object in a separate line, with booleans and numbers as JSON values,
+    reactions as lists of objects, and timestamps as ISO 8601 strings.
+    """
+
+    def __init__(self, file_path, column_names, column_types, resume_offset=None, resume_count=0,
+                 compression_level=None):
+        super().__init__(file_path, resume_offset, resume_count, compression_level)
+        self.column_names = column_names
+        self.column_types = column_types
+
+    def write_row(self, row):
+        record = {name: convert_value(column_type, value)
+                  for name, column_type, value in zip(self.column_names, self.column_types, row)}
+        self.fp.write(json.dumps(record, ensure_ascii=False, default=_to_json) + "\n")
+        self.count = self.count + 1
+
+
+def _to_json(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat().replace("+00:00", "Z")
+    raise TypeError("Type not serializable: " + str(type(value)))
+
+
+class ParquetWriter(object):
+    """
+    Writes rows with typed columns to a directory of compressed Parquet files (a dataset that can be read with
+    pandas.read_parquet(directory)). Rows are written in batches and each checkpoint completes the current file,
+    so that the files written up to the last checkpoint are always readable.
+    Requires the optional package pyarrow.
+    """
+
+    def __init__(self, file_path, column_names, column_types, resume_offset=None, resume_count=0,
+                 batch_size=PARQUET_BATCH_SIZE, compression="zstd"):
+        if pyarrow is None:
+            raise IllegalConfigurationError("The Parquet format requires the optional package pyarrow.")
+        self.file_path = file_path
+        self.column_types = column_types
+        self.batch_size = batch_size
+        self.compression = compression
+        self.schema = pyarrow.schema([pyarrow.field(name, _get_arrow_type(column_type))
+                                      for name, column_type in zip(column_names, column_types)])
+        self.count = 0
+        self.rows = []
+
+        # the offset of a Parquet dataset is the number of completed files
+        self.parts = 0
+        self.part_writer = None
+
+        if not os.path.exists(file_path):
+            os.makedirs(file_path)
+        if resume_offset is not None:
+            self.parts = resume_offset
+            self.count = resume_count
+        # discard files that have not been completed at the last checkpoint
+        for filename in os.listdir(file_path):
+            if filename.startswith("part-") and int(filename[5:10]) >= self.parts:
+                os.remove(os.path.join(file_path, filename))
+
+    def write_row(self, row):
+        self.rows.append(row)
+        self.count = self.count + 1
+        if len(self.rows) >= self.batch_size:
+            self._write_batch()
+
+    def _write_batch(self):
+        if len(self.rows) == 0:
+            return
+        if self.part_writer is None:
+            self.part_writer = pyarrow.parquet.ParquetWriter(self._get_part_path(self.parts), self.schema,
+                                                             compression=self.compression)
+        columns = [pyarrow.array([convert_value(column_type, value) for value in values], type=field.type)
+                   for column_type, field, values in zip(self.column_types, self.schema, zip(*self.rows))]
+        self.part_writer.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+        self.rows = []
+
+    def _get_part_path(self, index):
+        return os.path.join(self.file_path, "part-{0:05d}.parquet".format(index))
+
+    def checkpoint(self):
+        """
+        Write the remaining rows and complete the current file.
+        :return: Number of completed files.
+        """
+        self._write_batch()
+        if self.part_writer is not None:
+            self.part_writer.close()
+            self.part_writer = None
+            fd = os.open(self._get_part_path(self.parts), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.parts = self.parts + 1
+        return self.parts
+
+    def close(self):
+        self.checkpoint()
+
+
+def _get_arrow_type(column_type):
+    if column_type == "bool":
+        return pyarrow.bool_()
+    if column_type == "int":
+        return pyarrow.int64()
+    if column_type == "timestamp":
+        return pyarrow.timestamp("s", tz="UTC")
+    if column_type == "reactions":
+        return pyarrow.list_(pyarrow.struct([("emoji", pyarrow.string()), ("count", pyarrow.int64())]))
+    return pyarrow.string()